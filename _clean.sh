@@ -12,6 +12,10 @@ declare -a DIRS_TO_DELETE=(
 ".ipynb_checkpoints"
 "__pycache__"
 ".cache"
+".metrics"
+"schema-cache"
+"semantic-cache"
+"checkpoints"
 )
 
 echo "Before:"
@@ -18,7 +18,7 @@ os.environ.get("OPENAI_API_KEY")
 # ----------------------------------------
 # Function to get JWT for authentication
 import json
-import requests
+from conjurjwt import getHttpSession
 
 # function to get JWT from IDP given only a workload ID as parameter
 def jwtProvider_jwtThis(workload_id: str) -> str:
@@ -26,8 +26,8 @@ def jwtProvider_jwtThis(workload_id: str) -> str:
     jwt_issuer_url = "http://localhost:8000/token"
     urlenc_headers= { "Content-Type": "application/x-www-form-urlencoded" }
     payload = f"workload={workload_id}"
-    resp_dict = json.loads(requests.request("POST", jwt_issuer_url,
-                           headers=urlenc_headers, data=payload).text)
+    resp_dict = json.loads(getHttpSession().request("POST", jwt_issuer_url,
+                                   headers=urlenc_headers, data=payload).text)
     jwt = ""
     if resp_dict:
       jwt = resp_dict['access_token']
@@ -48,8 +48,10 @@ conjurRetriever = ConjurRetrieverJwt(conjur_subdomain, authn_jwt_id, jwtProvider
 username = ""
 password = ""
 try:
-    username = conjurRetriever.getSecret("data/vault/JodyDemo/K8sSecrets-MySQL/username", workload_id)
-    password = conjurRetriever.getSecret("data/vault/JodyDemo/K8sSecrets-MySQL/password", workload_id)
+    secrets = conjurRetriever.getSecrets(["data/vault/JodyDemo/K8sSecrets-MySQL/username",
+                                          "data/vault/JodyDemo/K8sSecrets-MySQL/password"], workload_id)
+    username = secrets["data/vault/JodyDemo/K8sSecrets-MySQL/username"]
+    password = secrets["data/vault/JodyDemo/K8sSecrets-MySQL/password"]
 except Exception as e:
     logging.error(e)
 
@@ -60,10 +62,19 @@ from langchain_community.utilities.sql_database import SQLDatabase
 address = '192.168.68.108'  # host IP
 port = 32203                # Node port
 database = 'petclinic'
-mysql_uri = f"mysql+mysqlconnector://{username}:{password}@{address}:{port}/{database}"
+
+from dbpool import PoolMetrics, mysqlUri, syncDriver, newEngine, warmPool
+
+# MYSQL_DRIVER picks the driver, see dbpool.py. The SQL agent is synchronous.
+mysql_uri = mysqlUri(username, password, address, port, database, driver=syncDriver())
 
 logging.debug(f"MySQL URI: {mysql_uri}")
-db = SQLDatabase.from_uri(mysql_uri)
+
+# Pool settings come from the MYSQL_POOL_* env vars, see dbpool.py
+poolMetrics = PoolMetrics()
+engine = newEngine(mysql_uri, metrics=poolMetrics)
+warmPool(engine)
+db = SQLDatabase(engine)
 
 database_schema = db.get_table_info()
 logging.debug(f"{database} schema: {database_schema}")
@@ -113,7 +124,9 @@ db_chain = SQLDatabaseChain( llm=llm, database=db, prompt=full_prompt, verbose=T
 
 def query_db(query):
     # Use the db_chain to perform the query
-    return db_chain.invoke(query)
+    result = db_chain.invoke(query)
+    logging.debug(f"pool stats: {poolMetrics.stats()}")
+    return result
 
 llm_config = {
     "config_list": config_list,
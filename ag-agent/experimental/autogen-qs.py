@@ -26,7 +26,7 @@ os.environ.get("OPENAI_API_KEY")
 # ----------------------------------------
 # Function to get JWT for authentication
 import json
-import requests
+from conjurjwt import getHttpSession
 
 # function to get JWT from IDP given only a workload ID as parameter
 def jwtProvider_jwtThis(workload_id: str) -> str:
@@ -34,8 +34,8 @@ def jwtProvider_jwtThis(workload_id: str) -> str:
     jwt_issuer_url = "http://localhost:8000/token"
     urlenc_headers= { "Content-Type": "application/x-www-form-urlencoded" }
     payload = f"workload={workload_id}"
-    resp_dict = json.loads(requests.request("POST", jwt_issuer_url,
-                           headers=urlenc_headers, data=payload).text)
+    resp_dict = json.loads(getHttpSession().request("POST", jwt_issuer_url,
+                                   headers=urlenc_headers, data=payload).text)
     jwt = ""
     if resp_dict:
       jwt = resp_dict['access_token']
@@ -56,8 +56,10 @@ conjurRetriever = ConjurRetrieverJwt(conjur_subdomain, authn_jwt_id, jwtProvider
 username = ""
 password = ""
 try:
-    username = conjurRetriever.getSecret("data/vault/JodyDemo/K8sSecrets-MySQL/username", workload_id)
-    password = conjurRetriever.getSecret("data/vault/JodyDemo/K8sSecrets-MySQL/password", workload_id)
+    secrets = conjurRetriever.getSecrets(["data/vault/JodyDemo/K8sSecrets-MySQL/username",
+                                          "data/vault/JodyDemo/K8sSecrets-MySQL/password"], workload_id)
+    username = secrets["data/vault/JodyDemo/K8sSecrets-MySQL/username"]
+    password = secrets["data/vault/JodyDemo/K8sSecrets-MySQL/password"]
 except Exception as e:
     logging.error(e)
 
@@ -1,4 +1,19 @@
 #!/bin/bash
+# Every worker loads its settings at startup from this file, then from env
+# vars (see ServiceConfig in conjur-service.py).
+export CONJUR_SVC_CONFIG=${CONJUR_SVC_CONFIG:-./svc-config.json}
+
+# Set SHARED_CACHE_SOCKET to have the workers share one token and secret
+# cache through the sharedcache.py sidecar.
+if [[ -n "$SHARED_CACHE_SOCKET" ]]; then
+  poetry run python sharedcache.py $SHARED_CACHE_SOCKET &
+  while [[ ! -S $SHARED_CACHE_SOCKET ]]; do sleep 0.1; done
+fi
+
+# Lets /metrics report on all workers, see svcmetrics.py
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-./.metrics}
+rm -rf $PROMETHEUS_MULTIPROC_DIR && mkdir -p $PROMETHEUS_MULTIPROC_DIR
+
 poetry run uvicorn conjur-service:app	\
         --host 0.0.0.0 --port 9000	\
         --workers 2               	\
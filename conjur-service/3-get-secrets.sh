@@ -0,0 +1,14 @@
+#!/bin/bash -x
+
+#curl -X POST http://localhost:9000/init
+
+SECRET_IDS='"data/vault/JodyDemo/K8sSecrets-MySQL/username", "data/vault/JodyDemo/K8sSecrets-MySQL/password"'
+WORKLOAD_ID="ai-agent"
+
+curl -X POST 						\
+	-H "Content-Type: application/json"		\
+	-d "{						\
+		\"secret_ids\": [ $SECRET_IDS ],	\
+		\"workload_id\": \"$WORKLOAD_ID\"	\
+	    }"						\
+	http://localhost:9000/getsecrets
@@ -0,0 +1,287 @@
+#!/usr/bin/python3
+
+import asyncio
+import inspect
+import logging
+import time
+import httpx
+from urllib.parse import quote
+
+from conjurjwt import (AUTHN_JWT_HEADERS, TOKEN_REFRESH_MARGIN_SECS,
+                       HTTP_POOL_SIZE, HTTP_TIMEOUT_SECS, HTTP_MAX_RETRIES,
+                       HTTP_BACKOFF_SECS, HTTP_RETRY_STATUSES, tokenExpiry,
+                       RetrieverMetrics, timedStage)
+
+# Pooled async HTTP client ============================================
+
+# Returns an httpx.AsyncClient with the same pool, keep-alive and timeout
+# settings as conjurjwt.newHttpSession(). Must be used on a single event loop.
+def newAsyncHttpClient(pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT_SECS) -> httpx.AsyncClient:
+  connect_timeout, read_timeout = timeout
+  limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+  return httpx.AsyncClient(limits=limits,
+                           timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+
+# Send a request, retrying connection errors and 429/5xx responses with
+# exponential backoff like the requests sessions in conjurjwt do.
+async def requestWithRetry(client: httpx.AsyncClient, method: str, url: str,
+                           max_retries=HTTP_MAX_RETRIES, backoff=HTTP_BACKOFF_SECS,
+                           **kwargs) -> httpx.Response:
+  for attempt in range(max_retries + 1):
+    last_attempt = attempt == max_retries
+    try:
+      resp = await client.request(method, url, **kwargs)
+    except httpx.TransportError as e:
+      if last_attempt:
+        raise
+      logging.info(f"{method} {url} failed ({e}), retrying...")
+    else:
+      if last_attempt or resp.status_code not in HTTP_RETRY_STATUSES:
+        return resp
+      logging.info(f"{method} {url} returned {resp.status_code}, retrying...")
+    await asyncio.sleep(backoff * (2 ** attempt))
+
+# asyncio version of conjurjwt._SingleFlight. Runs fn() once per key at a
+# time; concurrent callers with the same key await the same task. A caller
+# being cancelled doesn't cancel the shared call.
+class AsyncSingleFlight:
+
+  def __init__(self):
+    self.__private_calls = {}
+
+  async def __private_run(self, key, fn):
+    try:
+      return await fn()
+    finally:
+      del self.__private_calls[key]
+
+  async def do(self, key, fn):
+    call = self.__private_calls.get(key)
+    if call is None:
+      call = asyncio.create_task(self.__private_run(key, fn))
+      # keep an error nobody awaited from being reported as never retrieved
+      call.add_done_callback(lambda t: t.cancelled() or t.exception())
+      self.__private_calls[key] = call
+    return await asyncio.shield(call)
+
+# AsyncConjurRetrieverJwt ============================================
+
+class _CachedToken:
+  def __init__(self, token: str, expires_at: float):
+    self.token = token
+    self.expires_at = expires_at    # wall clock, seconds since epoch
+    self.used = False               # read since it was minted?
+    self.refresh = None             # asyncio.TimerHandle
+
+class AsyncConjurRetrieverJwt:
+  # asyncio counterpart of ConjurRetrieverJwt. jwtProvider may be a plain
+  # function or a coroutine function taking the workload ID.
+  #
+  # tokenStore optionally shares access tokens with other processes. It
+  # needs async getToken(workload_id) -> (token, expires_at) or None and
+  # async putToken(workload_id, token, expires_at), see sharedcache.py.
+
+  def __init__(self, cybr_tenant_subdomain, authn_jwt_id, jwtProvider,
+                refresh_margin=TOKEN_REFRESH_MARGIN_SECS, client=None, tokenStore=None,
+                metrics=None, conjur_url=None):
+    self.__private_jwtProvider = jwtProvider
+    self.metrics = metrics if metrics is not None else RetrieverMetrics()
+    self.__private_tokenStore = tokenStore
+    self.__private_rejected = {}    # workload_id -> last token Conjur refused
+    self.__private_ownsClient = client is None
+    self.__private_client = client if client is not None else newAsyncHttpClient()
+    # conjur_url overrides the Conjur Cloud API URL, e.g. to point at a test double
+    self.conjur_url = conjur_url or f"https://{cybr_tenant_subdomain}.secretsmgr.cyberark.cloud/api"
+    self.conjur_authn_url = f"{self.conjur_url}/authn-jwt/{authn_jwt_id}/conjur/authenticate"
+    self.refresh_margin = refresh_margin
+    self.__private_tokens = {}      # workload_id -> _CachedToken
+    self.__private_authnFlight = AsyncSingleFlight()
+    self.__private_fetchFlight = AsyncSingleFlight()
+    self.__private_tasks = set()
+
+  # Private ============================================
+
+  async def __private_getJwt(self, workload_id: str) -> str:
+    logging.info(f"Getting JWT from IDP for workload ID {workload_id}...")
+
+    with timedStage(self.metrics, "idp_jwt"):
+      jwt = self.__private_jwtProvider(workload_id)
+      if inspect.isawaitable(jwt):
+        jwt = await jwt
+    return jwt
+
+  async def __private_authnJwt(self, workload_id: str) -> str:
+    jwt = await self.__private_getJwt(workload_id)
+    logging.info("Authenticating to Conjur Cloud...")
+    payload = f"jwt={jwt}"
+    with timedStage(self.metrics, "conjur_authn") as stage:
+      resp = await requestWithRetry(self.__private_client, "POST", self.conjur_authn_url,
+                                    headers=AUTHN_JWT_HEADERS, content=payload)
+      stage.status = resp.status_code
+    if resp.is_success:
+      conjur_token = resp.text
+      logging.info("Authentication succeeded.")
+      logging.debug(f"Conjur token: {conjur_token}")
+    else:
+      raise RuntimeError(f"Authentication failed. HTTPS status code: {resp.status_code}")
+    return conjur_token
+
+  # A token another process already put in the shared store, if it is
+  # good for longer than the refresh margin and wasn't refused here
+  async def __private_sharedToken(self, workload_id: str):
+    if self.__private_tokenStore is None:
+      return None
+    try:
+      shared = await self.__private_tokenStore.getToken(workload_id)
+    except Exception as e:
+      logging.error(f"Shared token store unavailable: {e}")
+      return None
+    if shared is None:
+      return None
+    token, expires_at = shared
+    if token == self.__private_rejected.get(workload_id) \
+        or expires_at - self.refresh_margin <= time.time():
+      return None
+    logging.info(f"Using shared Conjur token for workload ID {workload_id}.")
+    return _CachedToken(token, expires_at)
+
+  # Authenticate and cache the new token. Only one authentication per
+  # workload ID is in flight at a time; other callers await its result.
+  async def __private_authenticate(self, workload_id: str) -> _CachedToken:
+    async def authn():
+      cached = await self.__private_sharedToken(workload_id)
+      if cached is None:
+        conjur_token = await self.__private_authnJwt(workload_id)
+        cached = _CachedToken(conjur_token, tokenExpiry(conjur_token))
+        if self.__private_tokenStore is not None:
+          try:
+            await self.__private_tokenStore.putToken(workload_id, cached.token, cached.expires_at)
+          except Exception as e:
+            logging.error(f"Shared token store unavailable: {e}")
+      self.__private_storeToken(workload_id, cached)
+      return cached
+    return await self.__private_authnFlight.do(workload_id, authn)
+
+  def __private_storeToken(self, workload_id: str, cached: _CachedToken):
+    delay = max(0, cached.expires_at - self.refresh_margin - time.time())
+    cached.refresh = asyncio.get_running_loop().call_later(
+                       delay, self.__private_scheduleRefresh, workload_id, cached)
+    old = self.__private_tokens.get(workload_id)
+    self.__private_tokens[workload_id] = cached
+    if old is not None and old.refresh is not None:
+      old.refresh.cancel()
+
+  def __private_scheduleRefresh(self, workload_id: str, cached: _CachedToken):
+    task = asyncio.create_task(self.__private_refresh(workload_id, cached))
+    self.__private_tasks.add(task)
+    task.add_done_callback(self.__private_tasks.discard)
+
+  # Background refresh, runs shortly before a token expires. Tokens nobody
+  # read since they were minted are dropped rather than renewed forever.
+  async def __private_refresh(self, workload_id: str, cached: _CachedToken):
+    if self.__private_tokens.get(workload_id) is not cached:
+      return
+    if not cached.used:
+      logging.info(f"Dropping idle Conjur token for workload ID {workload_id}.")
+      del self.__private_tokens[workload_id]
+      return
+    logging.info(f"Refreshing Conjur token for workload ID {workload_id}...")
+    try:
+      await self.__private_authenticate(workload_id)
+    except Exception as e:
+      # the current token stays usable until it expires
+      logging.error(f"Token refresh failed: {e}")
+
+  async def __private_getToken(self, workload_id: str) -> str:
+    cached = self.__private_tokens.get(workload_id)
+    hit = cached is not None and time.time() < cached.expires_at
+    self.metrics.cacheLookup("token", hit)
+    if not hit:
+      cached = await self.__private_authenticate(workload_id)
+    cached.used = True
+    return cached.token
+
+  def __private_dropToken(self, workload_id: str, conjur_token: str):
+    self.__private_rejected[workload_id] = conjur_token
+    cached = self.__private_tokens.get(workload_id)
+    if cached is None or cached.token != conjur_token:
+      return
+    del self.__private_tokens[workload_id]
+    if cached.refresh is not None:
+      cached.refresh.cancel()
+
+  # GET a Conjur resource with the workload's token, re-authenticating once
+  # if the cached token was revoked or expired early.
+  async def __private_get(self, url: str, workload_id: str, stage_name: str) -> httpx.Response:
+    conjur_token = await self.__private_getToken(workload_id)
+    access_headers = { "Content-Type": "application/json",
+                       "Authorization": f"Token token=\"{conjur_token}\""
+                     }
+    with timedStage(self.metrics, stage_name) as stage:
+      resp = await requestWithRetry(self.__private_client, "GET", url, headers=access_headers)
+      stage.status = resp.status_code
+    if resp.status_code == 401:
+      logging.info("Conjur token rejected, re-authenticating...")
+      self.__private_dropToken(workload_id, conjur_token)
+      conjur_token = await self.__private_getToken(workload_id)
+      access_headers["Authorization"] = f"Token token=\"{conjur_token}\""
+      with timedStage(self.metrics, stage_name) as stage:
+        resp = await requestWithRetry(self.__private_client, "GET", url, headers=access_headers)
+        stage.status = resp.status_code
+    return resp
+
+  async def __private_fetchSecret(self, secret_id: str, workload_id: str) -> str:
+    logging.info(f"Retrieving secret: {secret_id}")
+    secrets_url = f"{self.conjur_url}/secrets/conjur/variable/{secret_id}"
+    resp = await self.__private_get(secrets_url, workload_id, "secret_get")
+    if not resp.is_success:
+      raise RuntimeError(f"Secret retrieval failed. HTTP status code: {resp.status_code}")
+    secret_value = resp.text
+    logging.info("Secret retrieved successfully.")
+    logging.debug(f"Secret retrieved: {secret_value}")
+    return secret_value
+
+  async def __private_fetchSecrets(self, secret_ids: list[str], workload_id: str) -> dict[str, str]:
+    logging.info(f"Retrieving secrets: {secret_ids}")
+    resource_ids = {f"conjur:variable:{secret_id}": secret_id for secret_id in secret_ids}
+    variable_ids = ",".join(quote(resource_id, safe=":") for resource_id in resource_ids)
+    secrets_url = f"{self.conjur_url}/secrets?variable_ids={variable_ids}"
+    resp = await self.__private_get(secrets_url, workload_id, "secrets_batch_get")
+    if not resp.is_success:
+      raise RuntimeError(f"Batch secret retrieval failed. HTTP status code: {resp.status_code}")
+    secret_values = { resource_ids[resource_id]: value
+                      for resource_id, value in resp.json().items() }
+    logging.info("Secrets retrieved successfully.")
+    logging.debug(f"Secrets retrieved: {secret_values}")
+    return secret_values
+
+  # Public ============================================
+
+  # Concurrent requests for the same secret and workload ID share one
+  # upstream call and its result.
+  async def getSecret(self, secret_id: str, workload_id: str) -> str:
+    key = ("secret", workload_id, secret_id)
+    return await self.__private_fetchFlight.do(
+                   key, lambda: self.__private_fetchSecret(secret_id, workload_id))
+
+  # Same contract as ConjurRetrieverJwt.getSecrets: all values or an error
+  async def getSecrets(self, secret_ids: list[str], workload_id: str) -> dict[str, str]:
+    if not secret_ids:
+      return {}
+    key = ("secrets", workload_id, tuple(sorted(set(secret_ids))))
+    return await self.__private_fetchFlight.do(
+                   key, lambda: self.__private_fetchSecrets(secret_ids, workload_id))
+
+  # Forget all cached tokens, cancel their refreshes and close the HTTP
+  # client if this retriever created it
+  async def aclose(self):
+    for cached in self.__private_tokens.values():
+      if cached.refresh is not None:
+        cached.refresh.cancel()
+    self.__private_tokens.clear()
+    for task in list(self.__private_tasks):
+      task.cancel()
+    if self.__private_ownsClient:
+      await self.__private_client.aclose()
+
+# End AsyncConjurRetrieverJwt ============================================
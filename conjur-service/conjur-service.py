@@ -11,18 +11,62 @@ loglevel = logging.DEBUG
 logging.basicConfig(filename=logfile, encoding='utf-8', level=loglevel, filemode=logfmode)
 
 #----------------------------------------
-# Function to get JWT for authentication
+# Service configuration, loaded by every worker at startup. Defaults below
+# are overridden by the JSON file named in CONJUR_SVC_CONFIG (svc-config.json
+# if it exists and CONJUR_SVC_CONFIG isn't set), then by env vars named
+# after the fields in upper case (e.g. CONJUR_SUBDOMAIN).
 import json
-import requests
+import os
+from pydantic import BaseModel
+from secretcache import SECRET_CACHE_TTL_SECS, SECRET_CACHE_MAX_ENTRIES
+
+class ServiceConfig(BaseModel):
+  conjur_subdomain: str = "cybr-secrets"
+  authn_jwt_id: str = "agentic"
+  workload_id: str = "ai-agent"
+  jwt_issuer_url: str = "http://localhost:8000/token"
+  # Conjur API URL, defaults to the Conjur Cloud tenant's
+  conjur_url: str | None = None
+  secret_cache_ttl_secs: int = SECRET_CACHE_TTL_SECS
+  secret_cache_max_entries: int = SECRET_CACHE_MAX_ENTRIES
+  # Unix socket of the sharedcache.py sidecar. When set, all workers share
+  # its token and secret caches instead of keeping their own.
+  shared_cache_socket: str | None = None
+
+DEFAULT_CONFIG_FILE = "svc-config.json"
+
+def load_config() -> ServiceConfig:
+    settings = {}
+    config_file = os.environ.get("CONJUR_SVC_CONFIG")
+    if config_file is None and os.path.exists(DEFAULT_CONFIG_FILE):
+      config_file = DEFAULT_CONFIG_FILE
+    if config_file:
+      with open(config_file) as f:
+        settings.update(json.load(f))
+    for field in ServiceConfig.model_fields:
+      value = os.environ.get(field.upper())
+      if value is not None:
+        settings[field] = value
+    return ServiceConfig(**settings)
+
+config = None
+
+#----------------------------------------
+# Function to get JWT for authentication
+from asyncconjurjwt import newAsyncHttpClient, requestWithRetry
+
+# Pooled client shared by the IDP calls and the Conjur retriever
+httpClient = None
 
 # function to get JWT from IDP given only a workload ID as parameter
-def jwtProvider_jwtThis(workload_id: str) -> str:
+async def jwtProvider_jwtThis(workload_id: str) -> str:
     logging.info("IDP is jwt-this on localhost.")
-    jwt_issuer_url = "http://localhost:8000/token"
+    jwt_issuer_url = config.jwt_issuer_url
     urlenc_headers= { "Content-Type": "application/x-www-form-urlencoded" }
     payload = f"workload={workload_id}"
-    resp_dict = json.loads(requests.request("POST", jwt_issuer_url,
-                           headers=urlenc_headers, data=payload).text)
+    resp = await requestWithRetry(httpClient, "POST", jwt_issuer_url,
+                                  headers=urlenc_headers, content=payload)
+    resp_dict = resp.json()
     jwt = ""
     if resp_dict:
       jwt = resp_dict['access_token']
@@ -32,39 +76,208 @@ def jwtProvider_jwtThis(workload_id: str) -> str:
       raise RuntimeError(f"Error retrieving JWT. Response: {resp_dict}")
     return jwt
 
-from fastapi import FastAPI
-from pydantic import BaseModel
-app = FastAPI()
-
 #----------------------------------------
 # Get secrets from Conjur
-from conjurjwt import ConjurRetrieverJwt
+import asyncio
+from asyncconjurjwt import AsyncConjurRetrieverJwt, AsyncSingleFlight
+from sharedcache import SharedCacheClient, LocalSecretCache
+import svcmetrics
 conjurRetriever = None
+metrics = svcmetrics.PrometheusRetrieverMetrics()
+
+# Cache of secret values so repeat requests don't go upstream
+secretCache = None
+
+# Builds the config, HTTP client, secret cache and retriever together, so
+# they can be swapped in as a set
+def build_service():
+    svc_config = load_config()
+    client = newAsyncHttpClient()
+    tokenStore = None
+    if svc_config.shared_cache_socket:
+      logging.info(f"Sharing caches through {svc_config.shared_cache_socket}")
+      cache = tokenStore = SharedCacheClient(svc_config.shared_cache_socket,
+                                             ttl=svc_config.secret_cache_ttl_secs)
+    else:
+      cache = LocalSecretCache(ttl=svc_config.secret_cache_ttl_secs,
+                               max_entries=svc_config.secret_cache_max_entries)
+    retriever = AsyncConjurRetrieverJwt(svc_config.conjur_subdomain, svc_config.authn_jwt_id,
+                                        jwtProvider_jwtThis, client=client,
+                                        tokenStore=tokenStore, metrics=metrics,
+                                        conjur_url=svc_config.conjur_url)
+    return svc_config, client, cache, retriever
+
+async def close_service(client, cache, retriever):
+    if retriever is not None:
+      await retriever.aclose()
+    if cache is not None:
+      await cache.aclose()
+    if client is not None:
+      await client.aclose()
+
+async def startup():
+    global config, httpClient, secretCache, conjurRetriever
+    config, httpClient, secretCache, conjurRetriever = build_service()
+
+async def shutdown():
+    global httpClient, secretCache, conjurRetriever
+    await close_service(httpClient, secretCache, conjurRetriever)
+    conjurRetriever = secretCache = httpClient = None
+
+# Requests in flight when /init swaps the service objects keep using the
+# old ones, which are closed after this many seconds
+RELOAD_GRACE_SECS = float(os.environ.get("RELOAD_GRACE_SECS", 30))
+retiring = set()
+
+async def close_later(old):
+    await asyncio.sleep(RELOAD_GRACE_SECS)
+    await close_service(*old)
+
+async def reload():
+    global config, httpClient, secretCache, conjurRetriever
+    old = (httpClient, secretCache, conjurRetriever)
+    config, httpClient, secretCache, conjurRetriever = build_service()
+    task = asyncio.create_task(close_later(old))
+    retiring.add(task)
+    task.add_done_callback(retiring.discard)
+
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup()
+    yield
+    await shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+ROUTES = { "/init", "/getsecret", "/getsecrets", "/invalidate", "/cachestats", "/metrics" }
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    # label unknown paths as one route to keep metric cardinality bounded
+    route = request.url.path if request.url.path in ROUTES else "other"
+    in_flight = svcmetrics.REQUESTS_IN_FLIGHT.labels(route)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+      return await call_next(request)
+    finally:
+      in_flight.dec()
+      svcmetrics.REQUEST_LATENCY.labels(route).observe(time.perf_counter() - start)
+
+@app.get("/metrics")
+async def get_metrics() -> Response:
+    body, content_type = svcmetrics.render()
+    return Response(content=body, media_type=content_type)
 
+# Workers configure themselves at startup, so /init is no longer needed.
+# It reloads the configuration in the worker that receives it.
 @app.post("/init")
-def init() -> dict:
-    conjur_subdomain= "cybr-secrets"
-    authn_jwt_id = "agentic"
-    workload_id = "ai-agent"
+async def init() -> dict:
+    await reload()
+    return { "conjur_subdomain": config.conjur_subdomain,
+             "authn_jwt_id": config.authn_jwt_id,
+             "workload_id": config.workload_id,}
 
-    global conjurRetriever
-    conjurRetriever = ConjurRetrieverJwt(conjur_subdomain, authn_jwt_id, jwtProvider_jwtThis)
-    return { "conjur_subdomain": conjur_subdomain,
-             "authn_jwt_id": authn_jwt_id,
-             "workload_id": workload_id,}
+# The cache is an optimization: if the shared cache sidecar is down,
+# requests go upstream rather than fail.
+async def cache_get(workload_id: str, secret_id: str):
+    try:
+      secret = await secretCache.get(workload_id, secret_id)
+    except Exception as e:
+      logging.error(f"Secret cache unavailable: {e}")
+      secret = None
+    metrics.cacheLookup("secret", secret is not None)
+    return secret
+
+async def cache_put(workload_id: str, secrets: dict[str, str], version):
+    if version is None:
+      return
+    try:
+      for secret_id, value in secrets.items():
+        await secretCache.put(workload_id, secret_id, value, version)
+    except Exception as e:
+      logging.error(f"Secret cache unavailable: {e}")
+
+async def cache_version():
+    try:
+      return await secretCache.version()
+    except Exception as e:
+      logging.error(f"Secret cache unavailable: {e}")
+      return None
+
+# Cache misses for the same secret(s) and workload ID that arrive together,
+# e.g. from replicas starting at once, share one upstream fetch.
+secretFlight = AsyncSingleFlight()
+
+async def fetch_secret(secret_id: str, workload_id: str) -> str:
+    version = await cache_version()
+    secret = await conjurRetriever.getSecret(secret_id, workload_id)
+    await cache_put(workload_id, { secret_id: secret }, version)
+    return secret
+
+async def fetch_secrets(secret_ids: list[str], workload_id: str) -> dict[str, str]:
+    version = await cache_version()
+    secrets = await conjurRetriever.getSecrets(secret_ids, workload_id)
+    await cache_put(workload_id, secrets, version)
+    return secrets
 
 class SecretRequest(BaseModel):
   secret_id: str
   workload_id: str
 
 @app.post("/getsecret")
-def get_secret(req: SecretRequest) -> str:
-    secret = ""
+async def get_secret(req: SecretRequest) -> str:
     if conjurRetriever is None:
         logging.error("Conjur retriever was not initialized.")
         raise RuntimeError("Conjur retriever was not initialized.")
+    secret = await cache_get(req.workload_id, req.secret_id)
+    if secret is not None:
+      return secret
+    secret = ""
     try:
-      secret = conjurRetriever.getSecret(req.secret_id, req.workload_id)
+      secret = await secretFlight.do(("secret", req.workload_id, req.secret_id),
+                                     lambda: fetch_secret(req.secret_id, req.workload_id))
     except Exception as e:
       logging.error(e)
     return secret
+
+class SecretsRequest(BaseModel):
+  secret_ids: list[str]
+  workload_id: str
+
+@app.post("/getsecrets")
+async def get_secrets(req: SecretsRequest) -> dict[str, str]:
+    secrets = {}
+    if conjurRetriever is None:
+        logging.error("Conjur retriever was not initialized.")
+        raise RuntimeError("Conjur retriever was not initialized.")
+    cached = { secret_id: await cache_get(req.workload_id, secret_id)
+               for secret_id in req.secret_ids }
+    missing = [ secret_id for secret_id, value in cached.items() if value is None ]
+    if not missing:
+      return cached
+    try:
+      fetched = await secretFlight.do(("secrets", req.workload_id, tuple(sorted(missing))),
+                                      lambda: fetch_secrets(missing, req.workload_id))
+      secrets = cached | fetched
+    except Exception as e:
+      logging.error(e)
+    return secrets
+
+class InvalidateRequest(BaseModel):
+  workload_id: str | None = None
+  secret_id: str | None = None
+
+# Drop cached secrets, e.g. after a rotation. With no body, clears everything.
+# Without a shared cache this only reaches the worker that gets the request.
+@app.post("/invalidate")
+async def invalidate(req: InvalidateRequest = InvalidateRequest()) -> dict:
+    return { "invalidated": await secretCache.invalidate(req.workload_id, req.secret_id) }
+
+@app.get("/cachestats")
+async def cache_stats() -> dict:
+    return await secretCache.stats()
@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+
+# Local stand-ins for jwt-this and Conjur Cloud, for benchmarking
+# conjur-service offline. Serves:
+#
+#   POST /token                                          jwt-this
+#   POST /api/authn-jwt/{service_id}/conjur/authenticate Conjur authn-jwt
+#   GET  /api/secrets/conjur/variable/{secret_id}        Conjur secret
+#   GET  /api/secrets?variable_ids=...                   Conjur batch secrets
+#
+# Latency and failures are set with env vars:
+#   FAKE_IDP_LATENCY_MS, FAKE_AUTHN_LATENCY_MS, FAKE_SECRET_LATENCY_MS
+#   FAKE_FAILURE_RATE   fraction of calls answered with FAKE_FAILURE_STATUS
+#   FAKE_FAILURE_STATUS defaults to 503
+#   FAKE_TOKEN_TTL_SECS lifetime of the Conjur tokens handed out
+#
+# Run with: uvicorn --app-dir loadtest fake-upstream:app --port 8100
+
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+from collections import Counter
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, Header, Request, Response
+
+IDP_LATENCY_SECS = float(os.environ.get("FAKE_IDP_LATENCY_MS", 20)) / 1000
+AUTHN_LATENCY_SECS = float(os.environ.get("FAKE_AUTHN_LATENCY_MS", 80)) / 1000
+SECRET_LATENCY_SECS = float(os.environ.get("FAKE_SECRET_LATENCY_MS", 40)) / 1000
+FAILURE_RATE = float(os.environ.get("FAKE_FAILURE_RATE", 0))
+FAILURE_STATUS = int(os.environ.get("FAKE_FAILURE_STATUS", 503))
+TOKEN_TTL_SECS = int(os.environ.get("FAKE_TOKEN_TTL_SECS", 8 * 60))
+
+app = FastAPI()
+calls = Counter()
+
+# Sleep for the endpoint's latency, then maybe fail. Returns the error
+# response to send, or None to answer normally.
+async def simulate(endpoint: str, latency: float):
+  calls[endpoint] += 1
+  await asyncio.sleep(latency)
+  if random.random() < FAILURE_RATE:
+    calls[f"{endpoint}_failed"] += 1
+    return Response(status_code=FAILURE_STATUS)
+  return None
+
+# Same shape as a real Conjur token so tokenExpiry() can read it
+def fake_conjur_token(workload: str) -> str:
+  claims = { "sub": workload, "iat": int(time.time()), "exp": int(time.time()) + TOKEN_TTL_SECS }
+  payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+  token = { "protected": "fake", "payload": payload, "signature": "fake" }
+  return base64.b64encode(json.dumps(token).encode()).decode()
+
+# Read a urlencoded form field without FastAPI's python-multipart dependency
+async def form_field(request: Request, name: str) -> str:
+  form = parse_qs((await request.body()).decode())
+  return form.get(name, [""])[0]
+
+def authorized(authorization: str | None) -> bool:
+  return authorization is not None and authorization.startswith("Token token=")
+
+@app.post("/token")
+async def token(request: Request):
+  failed = await simulate("idp_token", IDP_LATENCY_SECS)
+  if failed:
+    return failed
+  workload = await form_field(request, "workload")
+  return { "access_token": f"fake-jwt-for-{workload}", "token_type": "Bearer" }
+
+@app.post("/api/authn-jwt/{service_id}/conjur/authenticate")
+async def authenticate(service_id: str, request: Request):
+  failed = await simulate("conjur_authn", AUTHN_LATENCY_SECS)
+  if failed:
+    return failed
+  jwt = await form_field(request, "jwt")
+  if not jwt.startswith("fake-jwt-for-"):
+    return Response(status_code=401)
+  return Response(content=fake_conjur_token(jwt.removeprefix("fake-jwt-for-")),
+                  media_type="text/plain")
+
+@app.get("/api/secrets/conjur/variable/{secret_id:path}")
+async def secret(secret_id: str, authorization: str | None = Header(None)):
+  failed = await simulate("secret_get", SECRET_LATENCY_SECS)
+  if failed:
+    return failed
+  if not authorized(authorization):
+    return Response(status_code=401)
+  return Response(content=f"value-of-{secret_id}", media_type="text/plain")
+
+@app.get("/api/secrets")
+async def secrets(variable_ids: str, authorization: str | None = Header(None)):
+  failed = await simulate("secrets_batch_get", SECRET_LATENCY_SECS)
+  if failed:
+    return failed
+  if not authorized(authorization):
+    return Response(status_code=401)
+  resource_ids = variable_ids.split(",")
+  return { resource_id: f"value-of-{resource_id.split(':', 2)[2]}" for resource_id in resource_ids }
+
+# Upstream call counts, to compare against the number of service requests
+@app.get("/calls")
+async def get_calls() -> dict:
+  return dict(calls)
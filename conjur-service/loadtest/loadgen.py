@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+
+# Load generator for conjur-service. Sends requests from a fixed number of
+# concurrent clients and reports throughput and latency percentiles.
+#
+#   python loadgen.py --concurrency 50 --requests 5000
+#   python loadgen.py --concurrency 200 --duration 30 --distinct 100
+#   python loadgen.py --batch 2           # POST /getsecrets with 2 IDs each
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+SECRET_ID_PREFIX = "data/vault/JodyDemo/K8sSecrets-MySQL"
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+  if not sorted_values:
+    return 0.0
+  index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+  return sorted_values[index]
+
+class Results:
+  def __init__(self):
+    self.latencies = []
+    self.errors = 0
+
+def request_body(args, n: int) -> tuple[str, dict]:
+  # spread requests over --distinct secret IDs so the cache sees misses
+  first = n % args.distinct
+  if args.batch > 1:
+    ids = [ f"{SECRET_ID_PREFIX}/secret-{(first + i) % args.distinct}" for i in range(args.batch) ]
+    return "/getsecrets", { "secret_ids": ids, "workload_id": args.workload_id }
+  return "/getsecret", { "secret_id": f"{SECRET_ID_PREFIX}/secret-{first}",
+                         "workload_id": args.workload_id }
+
+async def client_loop(client: httpx.AsyncClient, args, counter, deadline, results: Results):
+  while True:
+    n = next(counter)
+    if (args.requests and n >= args.requests) or (deadline and time.perf_counter() >= deadline):
+      return
+    route, body = request_body(args, n)
+    start = time.perf_counter()
+    try:
+      resp = await client.post(route, json=body)
+      # conjur-service answers "" or {} when the upstream fetch failed
+      ok = resp.is_success and resp.json() not in ("", {})
+    except httpx.HTTPError:
+      ok = False
+    results.latencies.append(time.perf_counter() - start)
+    if not ok:
+      results.errors += 1
+
+async def run(args) -> dict:
+  limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+  async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+    counter = iter(range(1 << 62))
+    results = Results()
+    start = time.perf_counter()
+    deadline = start + args.duration if args.duration else None
+    await asyncio.gather(*[ client_loop(client, args, counter, deadline, results)
+                            for _ in range(args.concurrency) ])
+    elapsed = time.perf_counter() - start
+  latencies = sorted(results.latencies)
+  ms = lambda secs: round(secs * 1000, 2)
+  return { "requests": len(latencies),
+           "errors": results.errors,
+           "concurrency": args.concurrency,
+           "elapsed_secs": round(elapsed, 2),
+           "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+           "latency_ms": { "mean": ms(statistics.fmean(latencies)) if latencies else 0.0,
+                           "p50": ms(percentile(latencies, 50)),
+                           "p95": ms(percentile(latencies, 95)),
+                           "p99": ms(percentile(latencies, 99)),
+                           "max": ms(latencies[-1]) if latencies else 0.0 } }
+
+def main():
+  parser = argparse.ArgumentParser(description="Load test conjur-service")
+  parser.add_argument("--url", default="http://localhost:9000", help="conjur-service base URL")
+  parser.add_argument("--concurrency", type=int, default=20, help="concurrent clients")
+  parser.add_argument("--requests", type=int, default=2000, help="total requests (0 = use --duration)")
+  parser.add_argument("--duration", type=float, default=0, help="seconds to run instead of --requests")
+  parser.add_argument("--distinct", type=int, default=2, help="distinct secret IDs to request")
+  parser.add_argument("--batch", type=int, default=1, help="secret IDs per request, >1 uses /getsecrets")
+  parser.add_argument("--workload-id", default="ai-agent")
+  parser.add_argument("--timeout", type=float, default=30)
+  args = parser.parse_args()
+  if args.duration:
+    args.requests = 0
+  print(json.dumps(asyncio.run(run(args)), indent=2))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,41 @@
+#!/bin/bash
+# Benchmark conjur-service against local fakes of jwt-this and Conjur Cloud.
+# Arguments are passed to loadgen.py, e.g.:
+#   ./run-loadtest.sh --concurrency 100 --requests 10000 --distinct 50
+# Fake upstream latency and failures are set with the FAKE_* env vars
+# described in fake-upstream.py. SECRET_CACHE_TTL_SECS=0 disables caching.
+set -o pipefail
+
+FAKE_PORT=${FAKE_PORT:-8100}
+SVC_PORT=${SVC_PORT:-9100}
+SVC_WORKERS=${SVC_WORKERS:-1}
+
+cd $(dirname $0)
+
+main() {
+  trap cleanup EXIT
+  poetry run uvicorn fake-upstream:app --port $FAKE_PORT --log-level warning &
+  FAKE_PID=$!
+  JWT_ISSUER_URL=http://localhost:$FAKE_PORT/token	\
+  CONJUR_URL=http://localhost:$FAKE_PORT/api		\
+    poetry run uvicorn --app-dir .. conjur-service:app	\
+        --port $SVC_PORT --workers $SVC_WORKERS		\
+        --log-level warning &
+  SVC_PID=$!
+  wait_for http://localhost:$FAKE_PORT/calls
+  wait_for http://localhost:$SVC_PORT/cachestats
+
+  poetry run python loadgen.py --url http://localhost:$SVC_PORT "$@"
+  echo "Upstream calls:"
+  curl -s http://localhost:$FAKE_PORT/calls; echo
+}
+
+wait_for() {
+  until curl -s -o /dev/null $1; do sleep 0.2; done
+}
+
+cleanup() {
+  kill $SVC_PID $FAKE_PID 2> /dev/null
+}
+
+main "$@"
@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+# SecretCache ============================================
+SECRET_CACHE_TTL_SECS = 300         # how long a cached secret value is served
+SECRET_CACHE_MAX_ENTRIES = 1000     # least recently used entries are evicted past this
+
+class _Entry:
+  def __init__(self, value: str, expires_at: float):
+    # held as a bytearray so the value can be overwritten when dropped
+    self.value = bytearray(value, "utf-8")
+    self.expires_at = expires_at
+
+  def zero(self):
+    for i in range(len(self.value)):
+      self.value[i] = 0
+
+class SecretCache:
+  # Bounded LRU of secret values keyed by (workload_id, secret_id). Values
+  # are zeroed when they expire, are evicted or invalidated.
+  #
+  # Every invalidate() bumps the cache version. Callers read version()
+  # before going upstream and pass it to put(), so a fetch that raced an
+  # invalidation can't put the stale value back.
+
+  def __init__(self, ttl=SECRET_CACHE_TTL_SECS, max_entries=SECRET_CACHE_MAX_ENTRIES):
+    self.ttl = ttl
+    self.max_entries = max_entries
+    self.__private_entries = OrderedDict()
+    self.__private_lock = threading.Lock()
+    self.__private_version = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  # Private ============================================
+
+  def __private_drop(self, key):
+    self.__private_entries.pop(key).zero()
+
+  # Public ============================================
+
+  def version(self) -> int:
+    with self.__private_lock:
+      return self.__private_version
+
+  def get(self, workload_id: str, secret_id: str):
+    key = (workload_id, secret_id)
+    with self.__private_lock:
+      entry = self.__private_entries.get(key)
+      if entry is not None and time.monotonic() >= entry.expires_at:
+        self.__private_drop(key)
+        entry = None
+      if entry is None:
+        self.misses += 1
+        return None
+      self.__private_entries.move_to_end(key)
+      self.hits += 1
+      return entry.value.decode("utf-8")
+
+  # ttl overrides self.ttl for this entry
+  def put(self, workload_id: str, secret_id: str, value: str, version: int, ttl=None):
+    key = (workload_id, secret_id)
+    with self.__private_lock:
+      if version != self.__private_version:
+        logging.debug(f"Not caching {secret_id}, cache was invalidated during fetch.")
+        return
+      if key in self.__private_entries:
+        self.__private_drop(key)
+      self.__private_entries[key] = _Entry(value, time.monotonic() + (self.ttl if ttl is None else ttl))
+      while len(self.__private_entries) > self.max_entries:
+        oldest = next(iter(self.__private_entries))
+        self.__private_drop(oldest)
+        self.evictions += 1
+
+  # Drop entries matching workload_id and/or secret_id, or everything if
+  # neither is given. Returns the number of entries dropped.
+  def invalidate(self, workload_id=None, secret_id=None) -> int:
+    with self.__private_lock:
+      self.__private_version += 1
+      keys = [ key for key in self.__private_entries
+               if (workload_id is None or key[0] == workload_id)
+               and (secret_id is None or key[1] == secret_id) ]
+      for key in keys:
+        self.__private_drop(key)
+    logging.info(f"Invalidated {len(keys)} cached secrets.")
+    return len(keys)
+
+  def stats(self) -> dict:
+    with self.__private_lock:
+      lookups = self.hits + self.misses
+      return { "entries": len(self.__private_entries),
+               "max_entries": self.max_entries,
+               "ttl_secs": self.ttl,
+               "hits": self.hits,
+               "misses": self.misses,
+               "hit_ratio": self.hits / lookups if lookups else 0.0,
+               "evictions": self.evictions,
+               "version": self.__private_version, }
+
+# End SecretCache ============================================
@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+
+# Sidecar that lets several uvicorn workers share one Conjur token cache and
+# one secret cache over a Unix socket, plus the async cache front ends the
+# service uses. Start it with:
+#
+#   python sharedcache.py /tmp/conjur-svc-cache.sock
+#
+# The protocol is one JSON request per line, answered by one JSON response
+# per line. The socket is created mode 0600: it hands out secrets.
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from secretcache import SecretCache, SECRET_CACHE_TTL_SECS, SECRET_CACHE_MAX_ENTRIES
+
+# Sidecar server ============================================
+
+class _CacheServer:
+
+  def __init__(self, ttl, max_entries):
+    self.secrets = SecretCache(ttl=ttl, max_entries=max_entries)
+    self.tokens = {}                # workload_id -> (token, expires_at)
+
+  def handle(self, req: dict):
+    op = req["op"]
+    if op == "secret_get":
+      return self.secrets.get(req["workload_id"], req["secret_id"])
+    if op == "secret_put":
+      self.secrets.put(req["workload_id"], req["secret_id"], req["value"], req["version"],
+                       ttl=req.get("ttl"))
+      return None
+    if op == "secret_version":
+      return self.secrets.version()
+    if op == "secret_invalidate":
+      return self.secrets.invalidate(req.get("workload_id"), req.get("secret_id"))
+    if op == "secret_stats":
+      return self.secrets.stats()
+    if op == "token_get":
+      cached = self.tokens.get(req["workload_id"])
+      if cached is not None and time.time() >= cached[1]:
+        del self.tokens[req["workload_id"]]
+        cached = None
+      return cached
+    if op == "token_put":
+      current = self.tokens.get(req["workload_id"])
+      # keep whichever token lives longest when workers race
+      if current is None or req["expires_at"] > current[1]:
+        self.tokens[req["workload_id"]] = (req["token"], req["expires_at"])
+      return None
+    raise ValueError(f"Unknown op: {op}")
+
+  async def serveClient(self, reader, writer):
+    try:
+      while line := await reader.readline():
+        try:
+          resp = { "result": self.handle(json.loads(line)) }
+        except Exception as e:
+          resp = { "error": str(e) }
+        writer.write(json.dumps(resp).encode() + b"\n")
+        await writer.drain()
+    finally:
+      writer.close()
+
+async def serve(socket_path: str, ttl=SECRET_CACHE_TTL_SECS,
+                max_entries=SECRET_CACHE_MAX_ENTRIES):
+  if os.path.exists(socket_path):
+    os.unlink(socket_path)
+  server = _CacheServer(ttl, max_entries)
+  old_umask = os.umask(0o177)
+  try:
+    sidecar = await asyncio.start_unix_server(server.serveClient, path=socket_path)
+  finally:
+    os.umask(old_umask)
+  logging.info(f"Shared cache listening on {socket_path}")
+  async with sidecar:
+    await sidecar.serve_forever()
+
+# Cache front ends ============================================
+
+class SharedCacheClient:
+  # Talks to the sidecar over one Unix socket connection per worker.
+  # Implements the secret cache interface the service uses and the token
+  # store interface AsyncConjurRetrieverJwt accepts. Secrets are put with
+  # ttl if given, otherwise with the sidecar's default.
+
+  def __init__(self, socket_path: str, ttl=None):
+    self.socket_path = socket_path
+    self.ttl = ttl
+    self.__private_lock = asyncio.Lock()
+    self.__private_reader = None
+    self.__private_writer = None
+
+  async def __private_call(self, op: str, **args):
+    req = json.dumps({ "op": op, **args }).encode() + b"\n"
+    async with self.__private_lock:
+      for attempt in range(2):
+        try:
+          if self.__private_writer is None:
+            self.__private_reader, self.__private_writer = \
+              await asyncio.open_unix_connection(self.socket_path)
+          self.__private_writer.write(req)
+          await self.__private_writer.drain()
+          line = await self.__private_reader.readline()
+          if not line:
+            raise ConnectionError("Shared cache closed the connection.")
+          break
+        except (ConnectionError, OSError):
+          # sidecar restarted, reconnect once
+          await self.__private_disconnect()
+          if attempt == 1:
+            raise
+    resp = json.loads(line)
+    if "error" in resp:
+      raise RuntimeError(f"Shared cache error: {resp['error']}")
+    return resp["result"]
+
+  async def __private_disconnect(self):
+    if self.__private_writer is not None:
+      self.__private_writer.close()
+    self.__private_reader = self.__private_writer = None
+
+  async def version(self) -> int:
+    return await self.__private_call("secret_version")
+
+  async def get(self, workload_id: str, secret_id: str):
+    return await self.__private_call("secret_get", workload_id=workload_id, secret_id=secret_id)
+
+  async def put(self, workload_id: str, secret_id: str, value: str, version: int):
+    await self.__private_call("secret_put", workload_id=workload_id, secret_id=secret_id,
+                              value=value, version=version, ttl=self.ttl)
+
+  async def invalidate(self, workload_id=None, secret_id=None) -> int:
+    return await self.__private_call("secret_invalidate",
+                                     workload_id=workload_id, secret_id=secret_id)
+
+  async def stats(self) -> dict:
+    return await self.__private_call("secret_stats")
+
+  async def getToken(self, workload_id: str):
+    cached = await self.__private_call("token_get", workload_id=workload_id)
+    return tuple(cached) if cached is not None else None
+
+  async def putToken(self, workload_id: str, token: str, expires_at: float):
+    await self.__private_call("token_put", workload_id=workload_id,
+                              token=token, expires_at=expires_at)
+
+  async def aclose(self):
+    async with self.__private_lock:
+      await self.__private_disconnect()
+
+class LocalSecretCache:
+  # Same async interface as SharedCacheClient over an in-process SecretCache,
+  # for when each worker keeps its own cache
+
+  def __init__(self, ttl=SECRET_CACHE_TTL_SECS, max_entries=SECRET_CACHE_MAX_ENTRIES):
+    self.cache = SecretCache(ttl=ttl, max_entries=max_entries)
+
+  async def version(self) -> int:
+    return self.cache.version()
+
+  async def get(self, workload_id: str, secret_id: str):
+    return self.cache.get(workload_id, secret_id)
+
+  async def put(self, workload_id: str, secret_id: str, value: str, version: int):
+    self.cache.put(workload_id, secret_id, value, version)
+
+  async def invalidate(self, workload_id=None, secret_id=None) -> int:
+    return self.cache.invalidate(workload_id, secret_id)
+
+  async def stats(self) -> dict:
+    return self.cache.stats()
+
+  async def aclose(self):
+    self.cache.invalidate()
+
+if __name__ == "__main__":
+  logging.basicConfig(level=logging.INFO)
+  socket_path = sys.argv[1] if len(sys.argv) > 1 else os.environ["SHARED_CACHE_SOCKET"]
+  asyncio.run(serve(socket_path,
+                    ttl=int(os.environ.get("SECRET_CACHE_TTL_SECS", SECRET_CACHE_TTL_SECS)),
+                    max_entries=int(os.environ.get("SECRET_CACHE_MAX_ENTRIES",
+                                                   SECRET_CACHE_MAX_ENTRIES))))
@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+
+# Prometheus metrics for conjur-service. With several uvicorn workers, set
+# PROMETHEUS_MULTIPROC_DIR to an empty directory before starting them so
+# /metrics reports all workers, not just the one that answers the scrape.
+
+import os
+
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram,
+                               CONTENT_TYPE_LATEST, REGISTRY, generate_latest, multiprocess)
+
+from conjurjwt import RetrieverMetrics
+
+# Seconds. Cached lookups land in the low buckets, upstream calls to
+# Conjur Cloud and the IDP in the tens to hundreds of milliseconds.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_LATENCY = Histogram("conjur_svc_stage_latency_seconds",
+                          "Latency of each upstream stage of a secret fetch",
+                          ["stage"], buckets=LATENCY_BUCKETS)
+UPSTREAM_ERRORS = Counter("conjur_svc_upstream_errors_total",
+                          "Failed upstream calls by stage and HTTP status code",
+                          ["stage", "status"])
+CACHE_LOOKUPS = Counter("conjur_svc_cache_lookups_total",
+                        "Token and secret cache lookups by result",
+                        ["cache", "result"])
+REQUEST_LATENCY = Histogram("conjur_svc_request_latency_seconds",
+                            "Latency of service requests by route",
+                            ["route"], buckets=LATENCY_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge("conjur_svc_requests_in_flight",
+                           "Service requests currently being handled",
+                           ["route"], multiprocess_mode="livesum")
+
+class PrometheusRetrieverMetrics(RetrieverMetrics):
+  # Feeds the retriever hooks into the metrics above
+
+  def observeStage(self, stage: str, seconds: float):
+    STAGE_LATENCY.labels(stage).observe(seconds)
+
+  def upstreamError(self, stage: str, status: str):
+    UPSTREAM_ERRORS.labels(stage, status).inc()
+
+  def cacheLookup(self, cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+# Exposition text for /metrics and its content type
+def render() -> tuple[bytes, str]:
+  if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+  else:
+    registry = REGISTRY
+  return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,6 +1,7 @@
 from langchain_core.messages import SystemMessage
 
 from k8s_bot.agents.k8s_tools import k8s_tools
+from k8s_bot.chat_history import HistoryManager
 from k8s_bot.helpers import get_model
 from k8s_bot.state_k8s import K8sState
 
@@ -11,13 +12,17 @@ Carefully identify the final parameters to be used to call the function. Pay att
 """
 )
 
+# Sends the last turns of the conversation and a summary of the rest
+history = HistoryManager()
+
 
 def get_k8s_engineer(state: K8sState):
-    # Create an instance of the LLM model
-    llama3 = get_model("Llama-3.1-8B-Instruct").bind_tools(k8s_tools)
+    # Get the LLM model, with the k8s tools bound
+    model = get_model("Llama-3.1-8B-Instruct")
+    llama3 = get_model("Llama-3.1-8B-Instruct", tools=k8s_tools)
 
     # Create a new messages array with the system message and global state messages
-    messages = [system_message] + state["messages"]
+    messages = history.trim([system_message] + state["messages"], model)
 
     # Add the llm response to the internal messages list
     return {"messages": [llama3.invoke(messages)]}
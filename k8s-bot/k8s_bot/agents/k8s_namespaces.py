@@ -0,0 +1,87 @@
+import logging
+import os
+import threading
+import time
+from functools import cache
+
+from kubernetes.client.rest import ApiException
+
+from k8s_bot.agents.k8s_tools import client
+
+NS_WATCH_TIMEOUT_SECS = int(os.environ.get("NS_WATCH_TIMEOUT_SECS", 300))
+NS_WATCH_RETRY_SECS = float(os.environ.get("NS_WATCH_RETRY_SECS", 5))
+NS_READY_TIMEOUT_SECS = float(os.environ.get("NS_READY_TIMEOUT_SECS", 10))
+
+
+class NamespaceCache:
+    # Names of the cluster's namespaces, kept in memory. A background thread
+    # lists them once, then watches for changes from the list's
+    # resourceVersion. Each watch resumes from the last version seen
+    # (bookmarks included), and only an expired version (410 Gone) makes it
+    # list again.
+    def __init__(self, api, watch_timeout=NS_WATCH_TIMEOUT_SECS, retry_secs=NS_WATCH_RETRY_SECS):
+        self.api = api
+        self.watch_timeout = watch_timeout
+        self.retry_secs = retry_secs
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.resource_version = None
+        self._names = set()
+        self.lists = 0
+        self.thread = threading.Thread(target=self._run, name="namespace-watch", daemon=True)
+        self.thread.start()
+
+    def _list(self):
+        namespaces = self.api.get()
+        with self.lock:
+            self._names = {item.metadata.name for item in namespaces.items}
+            self.resource_version = namespaces.metadata.resourceVersion
+            self.lists += 1
+        self.ready.set()
+        logging.info(f"Listed {len(self._names)} namespaces at version {self.resource_version}.")
+
+    def _watch(self):
+        for event in self.api.watch(
+            resource_version=self.resource_version,
+            timeout=self.watch_timeout,
+            allow_watch_bookmarks=True,
+        ):
+            metadata = event["object"].metadata
+            with self.lock:
+                if event["type"] in ("ADDED", "MODIFIED"):
+                    self._names.add(metadata.name)
+                elif event["type"] == "DELETED":
+                    self._names.discard(metadata.name)
+                self.resource_version = metadata.resourceVersion
+
+    def _run(self):
+        while True:
+            try:
+                if self.resource_version is None:
+                    self._list()
+                self._watch()
+            except ApiException as e:
+                if e.status == 410:
+                    logging.info("Namespace watch expired, listing again.")
+                    self.resource_version = None
+                    continue
+                logging.error(f"Namespace watch failed: {e}")
+                time.sleep(self.retry_secs)
+            except Exception as e:
+                logging.error(f"Namespace watch failed: {e}")
+                time.sleep(self.retry_secs)
+
+    # Sorted namespace names. Lists the cluster directly if the first list
+    # hasn't finished within timeout seconds.
+    def names(self, timeout=NS_READY_TIMEOUT_SECS):
+        if not self.ready.wait(timeout):
+            logging.warning("Namespace cache not ready, listing namespaces.")
+            return sorted(item.metadata.name for item in self.api.get().items)
+        with self.lock:
+            return sorted(self._names)
+
+
+# Started on first use, shared by every request
+@cache
+def get_namespace_cache():
+    return NamespaceCache(client.resources.get(api_version="v1", kind="Namespace"))
@@ -1,13 +1,32 @@
+import json
+import logging
+
 from langchain_core.messages import SystemMessage, HumanMessage
+from yaml import safe_dump
 
-from k8s_bot.agents.k8s_tools import get_resources
-from k8s_bot.helpers import get_model
+from k8s_bot.agents.k8s_namespaces import get_namespace_cache
+from k8s_bot.agents.ns_matcher import get_matcher
+from k8s_bot.helpers import extract_json, get_model
 from k8s_bot.state_k8s import K8sState
 
 
 def get_ns_identifier(state: K8sState):
-    # Get all the namespaces from the cluster
-    namespaces = get_resources(api_version="v1", kind="Namespace", namespace="all")
+    # Get all the namespaces from the cluster, kept in memory by a watch
+    names = get_namespace_cache().names()
+
+    # Match the namespace the expert found locally. The LLM is only asked
+    # when the match is ambiguous.
+    try:
+        wanted = str(extract_json(state["messages"][-1].content)["namespace"])
+    except (json.JSONDecodeError, KeyError, TypeError):
+        wanted = None
+    if wanted is not None:
+        namespace = get_matcher(tuple(names)).match(wanted)
+        if namespace is not None:
+            logging.info(f"Namespace {wanted!r} matched {namespace!r}.")
+            return {"messages": [HumanMessage(f"The namespace that should be used is: {namespace}")]}
+        logging.info(f"Namespace {wanted!r} is ambiguous, asking the LLM.")
+    namespaces = safe_dump(names)
 
     # Create a system message which includes the list of namespaces
     system_message = SystemMessage(
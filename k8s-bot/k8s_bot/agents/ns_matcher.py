@@ -0,0 +1,102 @@
+import os
+import re
+from functools import lru_cache
+
+NS_MATCH_MIN_SCORE = float(os.environ.get("NS_MATCH_MIN_SCORE", 0.6))
+NS_MATCH_MIN_MARGIN = float(os.environ.get("NS_MATCH_MIN_MARGIN", 0.1))
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def tokens(text: str) -> set:
+    return set(filter(None, re.split(r"[^a-z0-9]+", text)))
+
+
+def edit_distance(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def normalize(name: str) -> str:
+    return re.sub(r"[\s_.]+", "-", name.strip().lower())
+
+
+def compact(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "", name)
+
+
+class NamespaceMatcher:
+    # Finds the namespace closest to the one a user named. Candidates share
+    # a trigram with it, found through an index. Each is scored from 0 to 1
+    # on trigram overlap or edit distance, and on shared words. A match is
+    # ambiguous when the best score is under min_score, or within
+    # min_margin of the next best.
+    def __init__(self, names, min_score=NS_MATCH_MIN_SCORE, min_margin=NS_MATCH_MIN_MARGIN):
+        self.names = list(names)
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.index = {}  # trigram -> names
+        for name in self.names:
+            for trigram in trigrams(name) | trigrams(compact(name)):
+                self.index.setdefault(trigram, set()).add(name)
+
+    def score(self, wanted: str, name: str) -> float:
+        # How alike the names are with the separators dropped
+        wanted_compact, name_compact = compact(wanted), compact(name)
+        wanted_trigrams, name_trigrams = trigrams(wanted_compact), trigrams(name_compact)
+        trigram_score = len(wanted_trigrams & name_trigrams) / len(wanted_trigrams | name_trigrams)
+        edit_score = 1 - edit_distance(wanted_compact, name_compact) / max(
+            len(wanted_compact), len(name_compact), 1
+        )
+        # Share of the wanted words that start a word of name, or are a typo
+        # away from one
+        name_tokens = tokens(name)
+        wanted_tokens = tokens(wanted)
+        matched = [
+            word
+            for word in wanted_tokens
+            if any(
+                token.startswith(word)
+                or word.startswith(token)
+                or edit_distance(word, token) <= len(word) // 5
+                for token in name_tokens
+            )
+        ]
+        token_score = len(matched) / max(len(wanted_tokens), 1)
+        return 0.6 * max(trigram_score, edit_score) + 0.4 * token_score
+
+    # (name, score) of the best matches, best first
+    def candidates(self, wanted: str, limit=3):
+        wanted = normalize(wanted)
+        found = set()
+        for trigram in trigrams(wanted) | trigrams(compact(wanted)):
+            found |= self.index.get(trigram, set())
+        scored = sorted(((name, self.score(wanted, name)) for name in found),
+                        key=lambda match: (-match[1], match[0]))
+        return scored[:limit]
+
+    # The namespace the user meant, or None if it is ambiguous
+    def match(self, wanted: str):
+        for exact in (wanted, normalize(wanted)):
+            if exact in self.names:
+                return exact
+        candidates = self.candidates(wanted)
+        if not candidates or candidates[0][1] < self.min_score:
+            return None
+        if len(candidates) > 1 and candidates[0][1] - candidates[1][1] < self.min_margin:
+            return None
+        return candidates[0][0]
+
+
+# Matcher for a namespace list, rebuilt only when the list changes
+@lru_cache(maxsize=4)
+def get_matcher(names: tuple):
+    return NamespaceMatcher(names)
@@ -3,13 +3,12 @@ from typing import Literal, Union
 
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
 
 from k8s_bot.agents.k8s_tools import k8s_tool_node
 from k8s_bot.agents.engineer import get_k8s_engineer
 from k8s_bot.agents.expert import get_k8s_expert
 from k8s_bot.agents.ns_identifier import get_ns_identifier
-from k8s_bot.helpers import extract_json
+from k8s_bot.helpers import extract_json, get_checkpointer, get_thread
 from k8s_bot.state_k8s import K8sState
 
 
@@ -51,8 +50,8 @@ def get_graph():
     graph_builder.add_edge("k8s_engineer", "k8s_tool_node")
     graph_builder.add_edge("k8s_tool_node", END)
 
-    # Set up memory
-    memory = MemorySaver()
+    # Set up memory, kept on disk in CHECKPOINT_DIR with bounded retention
+    memory = get_checkpointer()
 
     # Build the graph
     return graph_builder.compile(checkpointer=memory)
@@ -60,7 +59,8 @@ def get_graph():
 
 def run(question: Union[str, None]):
     graph = get_graph()
-    thread: RunnableConfig = {"configurable": {"thread_id": "default"}}
+    # Continues the conversation in THREAD_ID, if set
+    thread: RunnableConfig = get_thread("k8s")
 
     # Get input from the user
     if question == None:
@@ -1,11 +1,11 @@
 from typing import Literal
 
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.runnables import RunnableConfig
 
 from k8s_bot.agents.human_input import get_human_input
 from k8s_bot.agents.input_verifier import get_input_verifier
+from k8s_bot.helpers import get_checkpointer, get_thread
 from k8s_bot.state_user_input import UserInputState
 
 
@@ -25,8 +25,8 @@ def get_graph():
         {"human_input": "human_input", "__end__": END},
     )
 
-    # Set up memory
-    memory = MemorySaver()
+    # Set up memory, kept on disk in CHECKPOINT_DIR with bounded retention
+    memory = get_checkpointer()
 
     # Build the graph
     return graph_builder.compile(checkpointer=memory, interrupt_before=["human_input"])
@@ -34,26 +34,26 @@ def get_graph():
 def main():
     # Get the graph
     graph = get_graph()
-    thread: RunnableConfig = {"configurable": {"thread_id": "default"}}
+    # A question left unanswered in THREAD_ID is asked again
+    thread: RunnableConfig = get_thread("input")
 
     while True:
-        initial_input = (
-            {"question": "", "is_valid": False}
-            if graph.get_state(thread).values == {}
-            else None
-        )
-        for event in graph.stream(initial_input, thread):
-            # Loop over each key in events and print the messages
-            for key in event:
-                print("\n*******************************************\n")
-                print(key + ":")
-                print("---------------------\n")
-                print(event[key]["verifier_response"])
-
-        # Check if we need to ask user or not
         next = graph.get_state(thread).next
-        if len(next) == 0 or next[0] != "human_input":
-            return graph.get_state(thread).values["question"]
+        if next != ("human_input",):
+            # A new question when the thread has finished, or is new
+            initial_input = None if next else {"question": "", "is_valid": False}
+            for event in graph.stream(initial_input, thread):
+                # Loop over each key in events and print the messages
+                for key in event:
+                    print("\n*******************************************\n")
+                    print(key + ":")
+                    print("---------------------\n")
+                    print(event[key]["verifier_response"])
+
+            # Check if we need to ask user or not
+            next = graph.get_state(thread).next
+            if len(next) == 0 or next[0] != "human_input":
+                return graph.get_state(thread).values["question"]
 
         # Get input from the user
         print("\n*******************************************\n")
@@ -1,19 +1,82 @@
 import json
 import os
+import uuid
+import threading
+from functools import cache
 
+import httpx
 from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableConfig
 from pydantic import SecretStr
 
+from k8s_bot.sqlite_saver import CHECKPOINT_DIR, DeltaSqliteSaver
+
 
 def extract_json(content: str) -> dict:
     json_text = content[content.find("{") : content.rfind("}") + 1]
     return json.loads(json_text)
 
 
-def get_model(model: str):
-    return ChatOpenAI(
-        base_url=os.environ["OPENAI_BASE_URL"],
-        api_key=SecretStr(os.environ["OPENAI_API_KEY"]),
-        model=model,
-        temperature=0.2,
+LLM_HTTP_MAX_CONNECTIONS = int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", 20))
+LLM_HTTP_TIMEOUT_SECS = float(os.environ.get("LLM_HTTP_TIMEOUT_SECS", 120))
+
+# (model, base_url, temperature, names of bound tools) -> model client
+_models = {}
+_models_lock = threading.Lock()
+
+
+# HTTP clients shared by every model client, so nodes reuse pooled
+# connections to OPENAI_BASE_URL instead of opening new ones
+@cache
+def _http_clients():
+    limits = httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_MAX_CONNECTIONS,
     )
+    return (
+        httpx.Client(limits=limits, timeout=LLM_HTTP_TIMEOUT_SECS),
+        httpx.AsyncClient(limits=limits, timeout=LLM_HTTP_TIMEOUT_SECS),
+    )
+
+
+# The client for model, with tools bound if given. Clients are built once
+# per process and shared by all the nodes.
+def get_model(model: str, tools=None, temperature: float = 0.2):
+    base_url = os.environ["OPENAI_BASE_URL"]
+    key = (model, base_url, temperature, tuple(tool.name for tool in tools or []))
+    with _models_lock:
+        client = _models.get(key)
+        if client is None:
+            http_client, http_async_client = _http_clients()
+            client = ChatOpenAI(
+                base_url=base_url,
+                api_key=SecretStr(os.environ["OPENAI_API_KEY"]),
+                model=model,
+                temperature=temperature,
+                http_client=http_client,
+                http_async_client=http_async_client,
+            )
+            if tools:
+                client = client.bind_tools(tools)
+            _models[key] = client
+    return client
+
+
+# Checkpointer shared by the graphs, conversations are kept in CHECKPOINT_DIR
+@cache
+def get_checkpointer():
+    return DeltaSqliteSaver(f"{CHECKPOINT_DIR}/k8s-bot.sqlite")
+
+
+# Conversation the graphs keep their state under. Set THREAD_ID to resume
+# an earlier one, a new one is started otherwise.
+@cache
+def get_thread_id() -> str:
+    thread_id = os.environ.get("THREAD_ID") or str(uuid.uuid4())
+    print(f"Conversation {thread_id}")
+    return thread_id
+
+
+# Each graph has its own state, so its own thread in the conversation
+def get_thread(graph: str) -> RunnableConfig:
+    return {"configurable": {"thread_id": f"{get_thread_id()}-{graph}"}}
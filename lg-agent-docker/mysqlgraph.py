@@ -0,0 +1,350 @@
+#!/usr/bin/python3
+
+# Builds the petclinic agent graph: a chatbot with a web search tool and a
+# SQL tool backed by a LangChain SQL agent over MySQL. build_graph() does the
+# expensive setup (Conjur secrets, DB pool, schema cache, agents) once and
+# returns a compiled graph that many conversations can share, each under
+# its own thread_id in the checkpointer. Used by lg-mysql.py (CLI) and
+# lg-server.py (HTTP/SSE).
+
+import logging
+import os, sys
+
+def _check_env(var: str):
+    if not os.environ.get(var):
+        print(f"Required env var {var} is not set.")
+        sys.exit(-1)
+
+#########################################
+# Get DB credentials from Conjur
+
+#----------------------------------------
+# Function to get JWT for authentication
+import json
+from conjurjwt import getHttpSession
+
+# function to get JWT from IDP given only a workload ID as parameter
+def jwtProvider_jwtThis(workload_id: str) -> str:
+    logging.info("IDP is jwt-this on localhost.")
+    jwt_issuer_url = "http://localhost:8000/token"
+    urlenc_headers= { "Content-Type": "application/x-www-form-urlencoded" }
+    payload = f"workload={workload_id}"
+    resp_dict = json.loads(getHttpSession().request("POST", jwt_issuer_url,
+                                   headers=urlenc_headers, data=payload).text)
+    jwt = ""
+    if resp_dict:
+      jwt = resp_dict['access_token']
+      logging.info("JWT retrieved successfully.")
+      logging.debug(f"JWT: {jwt}")
+    else:
+      raise RuntimeError(f"Error retrieving JWT. Response: {resp_dict}")
+    return jwt
+#----------------------------------------
+
+# Get secrets from Conjur
+from conjurjwt import ConjurRetrieverJwt
+
+conjur_subdomain= "cybr-secrets"
+authn_jwt_id = "agentic"
+workload_id = "ai-agent"
+
+def get_mysql_credentials() -> tuple[str, str]:
+    conjurRetriever = ConjurRetrieverJwt(conjur_subdomain, authn_jwt_id, jwtProvider_jwtThis)
+    username = ""
+    password = ""
+    try:
+      secrets = conjurRetriever.getSecrets(["data/vault/JodyDemo/K8sSecrets-MySQL/username",
+                                            "data/vault/JodyDemo/K8sSecrets-MySQL/password"], workload_id)
+      username = secrets["data/vault/JodyDemo/K8sSecrets-MySQL/username"]
+      password = secrets["data/vault/JodyDemo/K8sSecrets-MySQL/password"]
+    except Exception as e:
+      logging.error(e)
+    conjurRetriever.close()
+    return username, password
+
+address='192.168.68.108'  # cluster ip
+port=32203		  # nodeport
+database='petclinic'
+
+#########################################
+# Create SQL tool wrapper that invokes the SQL agent
+
+# Define the system message for the agent, including instructions and available tables
+system_message = f"""You are a MySQL expert agent designed to interact with a MySQL database.
+Given an input question, create a syntactically correct MySQL query to run, then look at the results of the query and return the answer.
+Unless the user specifies a specific number of examples they wish to obtain, always limit your query to at most 100 results using the LIMIT clause as per MySQL. You can order the results to return the most informative data in the database..
+You can order the results by a relevant column to return the most interesting examples in the database.
+Never query for all columns from a table. You must query only the columns that are needed to answer the question. Wrap each column name in double quotes (") to denote them as delimited identifiers.
+You have access to tools for interacting with the database.
+Only use the given tools. Only use the information returned by the tools to construct your final answer.
+You MUST double check your query before executing it. If you get an error while executing a query, rewrite the query and try again.
+
+DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.
+
+If the question does not seem related to the database, just return "I don't know" as the answer.
+Before you execute the query, tell us why you are executing it and what you expect to find briefly.
+The tables most relevant to the question are below. If they are not enough, use the tools to list and describe the other tables.
+{{relevant_tables}}
+"""
+
+def build_sql_tool(llm):
+    from langchain_community.utilities.sql_database import SQLDatabase
+    from dbpool import PoolMetrics, mysqlUri, syncDriver, newEngine, warmPool, startMetricsServer, MYSQL_POOL_METRICS_PORT
+    from schemacache import SchemaCache
+
+    username, password = get_mysql_credentials()
+
+    # MYSQL_DRIVER picks the driver, see dbpool.py. The SQL agent is synchronous.
+    mysql_uri = mysqlUri(username, password, address, port, database, driver=syncDriver())
+    logging.debug(f"MySQL URI: {mysql_uri}")
+
+    # Pool settings come from the MYSQL_POOL_* env vars, see dbpool.py
+    poolMetrics = PoolMetrics()
+    engine = newEngine(mysql_uri, metrics=poolMetrics)
+    warmPool(engine)
+    if MYSQL_POOL_METRICS_PORT:
+        startMetricsServer(int(MYSQL_POOL_METRICS_PORT))
+
+    # Table descriptions are cached on disk and only re-introspected when a
+    # table's definition changes, so restarts don't re-scan the database.
+    schemaCache = SchemaCache(engine, database)
+    db = SQLDatabase(engine, lazy_table_reflection=True,
+                     custom_table_info=schemaCache.tableInfos())
+
+    # Index of the cached table descriptions, used to put only the tables
+    # relevant to each question in the agent prompt
+    from tableretriever import TableRetriever
+    tableRetriever = TableRetriever(schemaCache.tableInfos())
+    logging.debug(f"{database} tables: {schemaCache.tableNames()}")
+
+    #----------------------------------------
+    # Create SQL agent to be used by DB tool
+    from langchain_community.agent_toolkits import create_sql_agent
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    from sqltools import StreamingSQLDatabaseToolkit
+    from querycache import QueryCache
+    from sqlguard import SqlGuard
+
+    # Results of repeated queries, dropped after QUERY_CACHE_TTL_SECS or when
+    # a table they read is written, see querycache.py
+    queryCache = QueryCache(engine)
+
+    # Refuses anything but bounded reads and queries EXPLAIN says are too
+    # expensive, see sqlguard.py
+    sqlGuard = SqlGuard(engine)
+
+    # Create a full prompt template for the agent using the system message and placeholders
+    full_prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", system_message),
+            ("human", '{input}'),
+            MessagesPlaceholder("agent_scratchpad")
+        ]
+    )
+
+    # Create the SQL agent using the LLM, database, and prompt template
+    # sql_db_query streams rows and caps the result, see sqltools.py
+    sqlToolkit = StreamingSQLDatabaseToolkit(db=db, llm=llm, query_cache=queryCache,
+                                             sql_guard=sqlGuard)
+    mysql_agent = create_sql_agent(
+        llm=llm,
+        toolkit=sqlToolkit,
+        prompt=full_prompt,
+        agent_type="tool-calling",
+        # intermediate steps hold the SQL that answered the question
+        agent_executor_kwargs={'handle_parsing_errors': True, 'return_intermediate_steps': True},
+        max_iterations=5,
+        verbose=True
+    )
+
+    #----------------------------------------
+    # Questions answered before, mapped to the SQL that answered them. A
+    # near-duplicate question reruns that SQL instead of the agent's LLM loop.
+    from langchain_openai import OpenAIEmbeddings
+    from semanticcache import SemanticCache, lastValidatedQuery
+
+    semanticCache = SemanticCache(OpenAIEmbeddings(model="text-embedding-3-small"),
+                                  database, schemaCache.fingerprint)
+    queryTool = next(tool for tool in sqlToolkit.get_tools() if tool.name == "sql_db_query")
+
+    def cached_sql_answer(user_input: str):
+        try:
+            sql = semanticCache.lookup(user_input)
+        except Exception as e:
+            logging.error(f"Semantic cache unavailable: {e}")
+            return None
+        if sql is None:
+            return None
+        result = queryTool.invoke(sql)
+        if result.startswith("Error"):
+            return None
+        return f"Result of the query {sql}\n{result}"
+
+    #----------------------------------------
+    from langchain_core.tools import tool
+
+    @tool
+    def sql_tool(user_input):
+        """
+        Executes a SQL query using the sqlite_agent and returns the result.
+
+        Args:
+            user_input (str): The SQL query to be executed.
+
+        Returns:
+            str: The result of the SQL query execution. If an error occurs, the exception is returned as a string.
+        """
+        try:
+            prediction = cached_sql_answer(user_input)
+            if prediction is not None:
+                return prediction
+
+            # Invoke the mysql_agent with the user input (SQL query) and the
+            # definitions of the tables relevant to it
+            relevant_tables = tableRetriever.tableInfo(user_input)
+            response = mysql_agent.invoke({"input": user_input,
+                                           "relevant_tables": relevant_tables})
+
+            # Extract the output from the response
+            prediction = response['output']
+            logging.debug(f"prediction: {prediction}")
+            sql = lastValidatedQuery(response.get('intermediate_steps'))
+            if sql is not None:
+                semanticCache.store(user_input, sql)
+            logging.debug(f"semantic cache stats: {semanticCache.stats()}")
+            logging.debug(f"pool stats: {poolMetrics.stats()}")
+            logging.debug(f"query cache stats: {queryCache.stats()}")
+        except Exception as e:
+            # If an exception occurs, capture the exception message
+            prediction = e
+
+        # Return the result or the exception message
+        return prediction
+
+    return sql_tool
+
+#########################################
+# Build graph
+
+# Create object for holding State and create StateGraph object
+from typing import Annotated
+from typing_extensions import TypedDict
+from langgraph.graph import StateGraph, START, END
+from langgraph.graph.message import add_messages
+
+class State(TypedDict):
+    # Messages have the type "list". The `add_messages` function
+    # in the annotation defines how this state key should be updated
+    # (in this case, it appends messages to the list, rather than overwriting them)
+    messages: Annotated[list, add_messages]
+
+# Builds the LLM, tools and agents and compiles the graph. Pass a
+# checkpointer to keep each thread_id's conversation between calls.
+def build_graph(checkpointer=None):
+    # Instantiate connection to hosted LLM
+    _check_env("OPENAI_API_KEY")
+
+    from langchain_openai import ChatOpenAI
+    llm = ChatOpenAI()
+    '''
+    from langchain_mistralai import ChatMistralAI
+    llm = ChatMistralAI(
+        model="mistral-large-latest",
+        temperature=0,
+        max_retries=2,
+        # other params...
+    )
+    '''
+
+    #----------------------------------------
+    # Create search tool
+    _check_env("TAVILY_API_KEY")
+
+    from langchain_community.tools.tavily_search import TavilySearchResults
+
+    searchtool = TavilySearchResults(max_results=2)
+
+    #----------------------------------------
+    # add tools to tool list
+    from langgraph.prebuilt import ToolNode, tools_condition
+
+    tools = [searchtool, build_sql_tool(llm)]
+    tool_node = ToolNode(tools=tools)
+
+    graph_builder = StateGraph(State)
+
+    graph_builder.add_node("tools", tool_node)
+    logging.debug(f"tool_node: {tool_node}")
+
+    # Tell the LLM which tools it can call
+    llm_with_tools = llm.bind_tools(tools)
+
+    # The state keeps the whole conversation, the LLM gets the last turns
+    # and a summary of the rest, see chathistory.py
+    from chathistory import HistoryManager
+    history = HistoryManager()
+
+    #----------------------------------------
+    # create chatbot node
+    def chatbot(state: State):
+        return {"messages": [llm_with_tools.invoke(history.trim(state["messages"], llm))]}
+
+    # The first argument is the unique node name
+    # The second argument is the function or object that will be called whenever
+    # the node is used.
+    graph_builder.add_node("chatbot", chatbot)
+
+    # The `tools_condition` function returns "tools" if the chatbot asks to use a tool, and "END" if
+    # it is fine directly responding. This conditional routing defines the main agent loop.
+    graph_builder.add_conditional_edges(
+        "chatbot",
+        tools_condition,
+        # The following dictionary lets you tell the graph to interpret the condition's outputs as a specific node
+        # It defaults to the identity function, but if you
+        # want to use a node named something else apart from "tools",
+        # You can update the value of the dictionary to something else
+        # e.g., "tools": "my_tools"
+        {"tools": "tools", END: END},
+    )
+
+    # Any time a tool is called, we return to the chatbot to decide the next step
+    graph_builder.add_edge("tools", "chatbot")
+    graph_builder.add_edge(START, "chatbot")
+    return graph_builder.compile(checkpointer=checkpointer)
+
+#########################################
+# Stream a turn token by token
+
+from langchain_core.messages import AIMessage
+from langgraph.constants import TAG_NOSTREAM
+
+# Pass to graph.stream()/astream() as stream_mode and hand each chunk to
+# turn_events()
+STREAM_MODES = ["messages", "updates"]
+
+# Events for one chunk of a STREAM_MODES stream:
+#   ("token", {"content"})             a piece of the chatbot's reply as the LLM generates it
+#   ("tool_start", {"name", "args"})   the chatbot called a tool
+#   ("tool_end", {"name", "content"})  the tool returned
+def turn_events(chunk) -> list[tuple[str, dict]]:
+    mode, payload = chunk
+    if mode == "messages":
+        message, metadata = payload
+        # The SQL agent's LLM streams too, from inside the tools node. Only
+        # the chatbot's reply goes to the user, not calls tagged nostream
+        # like the history summary (see chathistory.py).
+        if TAG_NOSTREAM in (metadata.get("tags") or ()):
+            return []
+        if metadata.get("langgraph_node") == "chatbot" and isinstance(message, AIMessage) \
+           and isinstance(message.content, str) and message.content:
+            return [("token", {"content": message.content})]
+        return []
+    events = []
+    for node, value in payload.items():
+        for msg in (value or {}).get("messages", []):
+            if msg.type == "ai":
+                events += [("tool_start", {"name": call["name"], "args": call["args"]})
+                           for call in msg.tool_calls]
+            elif msg.type == "tool":
+                events.append(("tool_end", {"name": msg.name, "content": msg.content}))
+    return events
@@ -0,0 +1,7 @@
+#!/bin/bash
+# Serves the agent over HTTP/SSE, see lg-server.py. One worker: the graph
+# and its conversations live in the process.
+source ./set_api_keys.sh
+poetry run uvicorn lg-server:app	\
+        --host 0.0.0.0 --port 8080	\
+        --log-level info
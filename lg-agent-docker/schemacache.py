@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+
+# On-disk cache of the table descriptions the SQL agent puts in its prompt.
+# Introspecting a table means reflecting it and querying sample rows, so it
+# is done once per table and kept in a JSON file per database. On startup a
+# single information_schema query fingerprints every table, and only tables
+# whose fingerprint changed (or that are new) are introspected again.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from sqlalchemy import text
+from langchain_community.utilities.sql_database import SQLDatabase
+
+# SchemaCache ============================================
+SCHEMA_CACHE_DIR = os.environ.get("SCHEMA_CACHE_DIR", "./schema-cache")
+SCHEMA_CACHE_FORMAT = 1             # bump when the file layout changes
+
+# Column definitions and table creation time. UPDATE_TIME is left out on
+# purpose: InnoDB moves it on every write, which would throw the cache away
+# although the schema is unchanged. ALTER TABLE rebuilds set CREATE_TIME.
+SCHEMA_FINGERPRINT_SQL = text("""
+  SELECT c.TABLE_NAME, c.COLUMN_NAME, c.ORDINAL_POSITION, c.COLUMN_TYPE,
+         c.IS_NULLABLE, c.COLUMN_KEY, c.COLUMN_DEFAULT, c.COLUMN_COMMENT,
+         t.CREATE_TIME, t.TABLE_COMMENT
+    FROM information_schema.COLUMNS c
+    JOIN information_schema.TABLES t
+      ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+   WHERE c.TABLE_SCHEMA = :database AND t.TABLE_TYPE = 'BASE TABLE'
+   ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION
+""")
+
+class SchemaCache:
+  # Table descriptions for one database, as SQLDatabase.get_table_info()
+  # formats them. Nothing touches the database until tableInfo() or
+  # tableInfos() is first called.
+
+  def __init__(self, engine, database: str, cache_dir=SCHEMA_CACHE_DIR,
+                sample_rows_in_table_info=3):
+    self.engine = engine
+    self.database = database
+    self.sample_rows_in_table_info = sample_rows_in_table_info
+    self.path = Path(cache_dir) / f"{database}.json"
+    self.fingerprint = None
+    self.__private_lock = threading.Lock()
+    self.__private_tables = None      # table name -> { "fingerprint", "info" }
+
+  # Private ============================================
+
+  # Fingerprint of each table's definition, from one information_schema query
+  def __private_fingerprints(self) -> dict[str, str]:
+    hashes = {}
+    with self.engine.connect() as conn:
+      for row in conn.execute(SCHEMA_FINGERPRINT_SQL, { "database": self.database }):
+        table = row[0]
+        if table not in hashes:
+          hashes[table] = hashlib.sha256()
+        hashes[table].update(repr(tuple(row[1:])).encode("utf-8"))
+    return { table: h.hexdigest() for table, h in hashes.items() }
+
+  def __private_read(self) -> dict:
+    try:
+      with open(self.path) as f:
+        cached = json.load(f)
+      if cached.get("format") == SCHEMA_CACHE_FORMAT and cached.get("database") == self.database:
+        return cached["tables"]
+    except FileNotFoundError:
+      pass
+    except Exception as e:
+      logging.warning(f"Ignoring unreadable schema cache {self.path}: {e}")
+    return {}
+
+  def __private_write(self):
+    self.path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = self.path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+      json.dump({ "format": SCHEMA_CACHE_FORMAT,
+                  "database": self.database,
+                  "fingerprint": self.fingerprint,
+                  "tables": self.__private_tables }, f)
+    os.replace(tmp_path, self.path)
+
+  def __private_introspect(self, table_names: list[str]) -> dict[str, str]:
+    db = SQLDatabase(self.engine, include_tables=table_names, lazy_table_reflection=True,
+                     sample_rows_in_table_info=self.sample_rows_in_table_info)
+    return { table: db.get_table_info([table]) for table in table_names }
+
+  def __private_load(self):
+    fingerprints = self.__private_fingerprints()
+    self.fingerprint = hashlib.sha256(
+      json.dumps(fingerprints, sort_keys=True).encode("utf-8")).hexdigest()
+    cached = self.__private_read()
+    tables = { table: entry for table, entry in cached.items()
+               if fingerprints.get(table) == entry["fingerprint"] }
+    stale = sorted(set(fingerprints) - set(tables))
+    if stale:
+      logging.info(f"Introspecting {len(stale)} of {len(fingerprints)} tables in {self.database}.")
+      for table, info in self.__private_introspect(stale).items():
+        tables[table] = { "fingerprint": fingerprints[table], "info": info }
+    self.__private_tables = tables
+    if stale or len(tables) != len(cached):
+      self.__private_write()
+    else:
+      logging.info(f"Schema of {self.database} unchanged, using {self.path}")
+
+  def __private_loaded(self) -> dict:
+    with self.__private_lock:
+      if self.__private_tables is None:
+        self.__private_load()
+      return self.__private_tables
+
+  # Public ============================================
+
+  def tableNames(self) -> list[str]:
+    return sorted(self.__private_loaded())
+
+  # table name -> description, e.g. as SQLDatabase's custom_table_info
+  def tableInfos(self) -> dict[str, str]:
+    return { table: entry["info"] for table, entry in self.__private_loaded().items() }
+
+  # Descriptions of the given tables (default all), joined like get_table_info()
+  def tableInfo(self, table_names=None) -> str:
+    infos = self.tableInfos()
+    if table_names is None:
+      table_names = infos.keys()
+    return "\n\n".join(sorted(infos[table] for table in table_names))
+
+  # Drop the in-memory copy so the next call re-checks the fingerprint
+  def refresh(self):
+    with self.__private_lock:
+      self.__private_tables = None
+
+# End SchemaCache ============================================
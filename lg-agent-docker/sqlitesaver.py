@@ -0,0 +1,503 @@
+#!/usr/bin/python3
+
+# LangGraph checkpointer that keeps conversation state in a local SQLite
+# file, so threads survive a restart and memory doesn't grow with them.
+#
+#   - WAL mode: readers don't block the writer, a crash loses at most the
+#     checkpoint being written.
+#   - Deltas: a channel value is stored once per version, like MemorySaver.
+#     A list (the add_messages "messages" channel) that only grew since the
+#     version before it is stored as the new items plus a reference to that
+#     version. Every CHECKPOINT_SNAPSHOT_EVERY deltas a full copy is stored,
+#     so rebuilding a value reads a bounded chain.
+#   - Retention: every CHECKPOINT_COMPACT_EVERY checkpoints a thread is
+#     compacted to its newest CHECKPOINT_KEEP checkpoints (per namespace).
+#     Threads not written for CHECKPOINT_THREAD_TTL_DAYS are deleted.
+#
+#   graph = graph_builder.compile(checkpointer=DeltaSqliteSaver("./checkpoints/app.sqlite"))
+
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+
+try:
+    from langgraph.checkpoint.base import get_checkpoint_metadata
+except ImportError:  # langgraph-checkpoint < 2.0.16 stores the metadata as given
+
+    def get_checkpoint_metadata(config, metadata):
+        return metadata
+
+
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", "./checkpoints")
+CHECKPOINT_KEEP = int(os.environ.get("CHECKPOINT_KEEP", 20))
+CHECKPOINT_COMPACT_EVERY = int(os.environ.get("CHECKPOINT_COMPACT_EVERY", 50))
+CHECKPOINT_SNAPSHOT_EVERY = int(os.environ.get("CHECKPOINT_SNAPSHOT_EVERY", 20))
+CHECKPOINT_THREAD_TTL_DAYS = float(os.environ.get("CHECKPOINT_THREAD_TTL_DAYS", 30))  # 0 keeps threads forever
+LAST_LISTS_SIZE = 1024  # lists remembered as delta bases, least recently stored dropped first
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    base_version TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    blob BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Type prefix of the blobs that hold the items appended to base_version's list
+DELTA = "delta:"
+
+
+# Digest of a list's items, to tell whether a new list starts with them
+# without keeping the items. Items are compared serialized, so a message
+# updated in place (new tool_calls, same id and content) doesn't match.
+# Returns the digests of items[:prefix_len] (None if items is shorter) and
+# of items.
+def list_digests(items, serde, prefix_len=0):
+    digest = hashlib.sha1()
+    prefix = digest.digest() if prefix_len == 0 else None
+    for i, item in enumerate(items, 1):
+        type_, blob = serde.dumps_typed(item)
+        digest.update(type_.encode())
+        digest.update(len(blob).to_bytes(8, "big"))
+        digest.update(blob)
+        if i == prefix_len:
+            prefix = digest.digest()
+    return prefix, digest.digest()
+
+
+class DeltaSqliteSaver(BaseCheckpointSaver[str]):
+    def __init__(
+        self,
+        path=f"{CHECKPOINT_DIR}/checkpoints.sqlite",
+        keep=CHECKPOINT_KEEP,
+        compact_every=CHECKPOINT_COMPACT_EVERY,
+        snapshot_every=CHECKPOINT_SNAPSHOT_EVERY,
+        thread_ttl_days=CHECKPOINT_THREAD_TTL_DAYS,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.path = path
+        self.keep = max(keep, 1)  # the newest checkpoint is the base of the next delta
+        self.compact_every = compact_every
+        self.snapshot_every = snapshot_every
+        self.thread_ttl_secs = thread_ttl_days * 24 * 3600
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.RLock()
+        # (thread_id, checkpoint_ns, channel) -> (version, length, digest, deltas
+        # since a full copy) of the last list stored, the base for the next delta
+        self.last_lists = OrderedDict()
+        self.puts = {}  # thread_id -> checkpoints written since its last compaction
+        self.expire_threads()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # Storing values ============================================
+
+    def _dump_value(self, key, version, value):
+        if not isinstance(value, list):
+            return (*self.serde.dumps_typed(value), None)
+        last = self.last_lists.pop(key, None)
+        base_version, base_len, base_digest, deltas = last or (None, 0, None, 0)
+        prefix_digest, digest = list_digests(value, self.serde, base_len)
+        self.last_lists[key] = (version, len(value), digest, 0)
+        while len(self.last_lists) > LAST_LISTS_SIZE:
+            self.last_lists.popitem(last=False)
+        if last is not None:
+            if deltas < self.snapshot_every and prefix_digest == base_digest:
+                self.last_lists[key] = (version, len(value), digest, deltas + 1)
+                type_, blob = self.serde.dumps_typed(value[base_len:])
+                return DELTA + type_, blob, base_version
+        return (*self.serde.dumps_typed(value), None)
+
+    def _load_value(self, thread_id, checkpoint_ns, channel, version):
+        row = self.conn.execute(
+            "SELECT type, blob, base_version FROM blobs"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+            (thread_id, checkpoint_ns, channel, version),
+        ).fetchone()
+        if row is None or row[0] == "empty":
+            return None
+        type_, blob, base_version = row
+        if not type_.startswith(DELTA):
+            return self.serde.loads_typed((type_, blob))
+        base = self._load_value(thread_id, checkpoint_ns, channel, base_version)
+        return list(base or []) + self.serde.loads_typed((type_[len(DELTA) :], blob))
+
+    def _load_channel_values(self, thread_id, checkpoint_ns, channel_versions):
+        values = {}
+        for channel, version in channel_versions.items():
+            value = self._load_value(thread_id, checkpoint_ns, channel, version)
+            if value is not None:
+                values[channel] = value
+        return values
+
+    def _tuple(self, row):
+        thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, blob, metadata_type, metadata = row
+        checkpoint = self.serde.loads_typed((type_, blob))
+        writes = self.conn.execute(
+            "SELECT task_id, channel, type, blob FROM writes"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+            " ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_channel_values(
+                    thread_id, checkpoint_ns, checkpoint["channel_versions"]
+                ),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((type_, blob)))
+                for task_id, channel, type_, blob in writes
+            ],
+        )
+
+    # BaseCheckpointSaver ============================================
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,"
+            " type, checkpoint, metadata_type, metadata FROM checkpoints"
+            " WHERE thread_id = ? AND checkpoint_ns = ?"
+        )
+        params = [thread_id, checkpoint_ns]
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        else:
+            query += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self.lock:
+            row = self.conn.execute(query, params).fetchone()
+            return self._tuple(row) if row else None
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,"
+            " type, checkpoint, metadata_type, metadata FROM checkpoints WHERE 1 = 1"
+        )
+        params = []
+        if config:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                query += " AND checkpoint_ns = ?"
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params.append(before_id)
+        query += " ORDER BY checkpoint_id DESC"
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            if filter:
+                metadata = self.serde.loads_typed((row[6], row[7]))
+                if not all(metadata.get(key) == value for key, value in filter.items()):
+                    continue
+            if limit is not None:
+                limit -= 1
+            with self.lock:
+                checkpoint_tuple = self._tuple(row)
+            yield checkpoint_tuple
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint = checkpoint.copy()
+        values = checkpoint.pop("channel_values")
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                for channel, version in new_versions.items():
+                    if channel in values:
+                        key = (thread_id, checkpoint_ns, channel)
+                        type_, blob, base_version = self._dump_value(key, version, values[channel])
+                    else:
+                        type_, blob, base_version = "empty", None, None
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (thread_id, checkpoint_ns, channel, version, type_, blob, base_version),
+                    )
+                type_, blob = self.serde.dumps_typed(checkpoint)
+                metadata_type, metadata_blob = self.serde.dumps_typed(
+                    get_checkpoint_metadata(config, metadata)
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint["id"],
+                        config["configurable"].get("checkpoint_id"),
+                        type_,
+                        blob,
+                        metadata_type,
+                        metadata_blob,
+                    ),
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, time.time())
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                # the next list is stored in full rather than against a lost base
+                self.last_lists = OrderedDict(
+                    (key, last) for key, last in self.last_lists.items() if key[0] != thread_id
+                )
+                raise
+            self.puts[thread_id] = self.puts.get(thread_id, 0) + 1
+            if self.compact_every and self.puts[thread_id] >= self.compact_every:
+                self.compact(thread_id)
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            rows.append(
+                (
+                    "REPLACE" if channel in WRITES_IDX_MAP else "IGNORE",
+                    (thread_id, checkpoint_ns, checkpoint_id, task_id,
+                     WRITES_IDX_MAP.get(channel, idx), channel, type_, blob, task_path),
+                )
+            )
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                for conflict, row in rows:
+                    self.conn.execute(
+                        f"INSERT OR {conflict} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row
+                    )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def delete_thread(self, thread_id):
+        with self.lock:
+            self.conn.execute("BEGIN")
+            for table in ("checkpoints", "blobs", "writes", "threads"):
+                self.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            self.conn.execute("COMMIT")
+            self.last_lists = OrderedDict(
+                (key, last) for key, last in self.last_lists.items() if key[0] != thread_id
+            )
+            self.puts.pop(thread_id, None)
+
+    # SQLite calls block, keep them off the event loop
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        tuples = await asyncio.to_thread(
+            lambda: [*self.list(config, filter=filter, before=before, limit=limit)]
+        )
+        for checkpoint_tuple in tuples:
+            yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # Versions sort as strings, compact() relies on it
+    def get_next_version(self, current, channel):
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # Retention ============================================
+
+    # Drops all but the newest self.keep checkpoints of each namespace of
+    # thread_id, their pending writes and the channel values only they used
+    def compact(self, thread_id):
+        with self.lock:
+            self.puts[thread_id] = 0
+            self.conn.execute("BEGIN")
+            try:
+                dropped = self._compact(thread_id)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            if dropped:
+                logging.info(f"Compacted thread {thread_id}: dropped {dropped} checkpoints.")
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _compact(self, thread_id):
+        dropped = 0
+        namespaces = [
+            ns for (ns,) in self.conn.execute(
+                "SELECT DISTINCT checkpoint_ns FROM checkpoints WHERE thread_id = ?", (thread_id,)
+            )
+        ]
+        for ns in namespaces:
+            old = [
+                checkpoint_id for (checkpoint_id,) in self.conn.execute(
+                    "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+                    " ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+                    (thread_id, ns, self.keep),
+                )
+            ]
+            if not old:
+                continue
+            dropped += len(old)
+            for table in ("checkpoints", "writes"):
+                self.conn.executemany(
+                    f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    [(thread_id, ns, checkpoint_id) for checkpoint_id in old],
+                )
+            # Channel versions the remaining checkpoints use
+            used = set()
+            for type_, blob in self.conn.execute(
+                "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, ns),
+            ):
+                used.update(self.serde.loads_typed((type_, blob))["channel_versions"].items())
+            # A used delta whose base is going away is stored in full
+            for channel, version, base_version in self.conn.execute(
+                "SELECT channel, version, base_version FROM blobs"
+                " WHERE thread_id = ? AND checkpoint_ns = ? AND base_version IS NOT NULL",
+                (thread_id, ns),
+            ).fetchall():
+                if (channel, version) in used and (channel, base_version) not in used:
+                    value = self._load_value(thread_id, ns, channel, version)
+                    type_, blob = self.serde.dumps_typed(value)
+                    self.conn.execute(
+                        "UPDATE blobs SET type = ?, blob = ?, base_version = NULL WHERE thread_id = ?"
+                        " AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                        (type_, blob, thread_id, ns, channel, version),
+                    )
+            # Every base of a used delta is now used too, the rest can go
+            needed = set(used)
+            for channel, version, base_version in self.conn.execute(
+                "SELECT channel, version, base_version FROM blobs WHERE thread_id = ?"
+                " AND checkpoint_ns = ? AND base_version IS NOT NULL ORDER BY version DESC",
+                (thread_id, ns),
+            ).fetchall():
+                if (channel, version) in needed:
+                    needed.add((channel, base_version))
+            self.conn.executemany(
+                "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                [
+                    (thread_id, ns, channel, version)
+                    for channel, version in self.conn.execute(
+                        "SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                        (thread_id, ns),
+                    ).fetchall()
+                    if (channel, version) not in needed
+                ],
+            )
+        return dropped
+
+    # Deletes the threads not written for thread_ttl_days
+    def expire_threads(self):
+        if not self.thread_ttl_secs:
+            return
+        with self.lock:
+            expired = [
+                thread_id for (thread_id,) in self.conn.execute(
+                    "SELECT thread_id FROM threads WHERE updated_at < ?",
+                    (time.time() - self.thread_ttl_secs,),
+                ).fetchall()
+            ]
+            for thread_id in expired:
+                self.delete_thread(thread_id)
+        if expired:
+            logging.info(f"Deleted {len(expired)} threads idle for over {self.thread_ttl_secs / 86400:g} days.")
@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+
+# Keeps the messages sent to the LLM bounded as a conversation grows. The
+# graph state keeps every message, trim() picks what a call sends:
+#   - the leading system messages (the node's prompt)
+#   - the last HISTORY_KEEP_TURNS turns verbatim, a turn being a human
+#     message and everything after it up to the next one
+#   - a summary of the turns before them
+#
+# The summary is cached per conversation and rolled forward in one LLM call
+# when it goes stale: when more than twice HISTORY_KEEP_TURNS turns follow
+# it, or they no longer fit in HISTORY_MAX_TOKENS. Token counts are cached
+# per message id, so each call only counts the new messages.
+#
+#   messages = history.trim([system_message] + state["messages"], llm)
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langgraph.constants import TAG_NOSTREAM
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+HISTORY_KEEP_TURNS = int(os.environ.get("HISTORY_KEEP_TURNS", 4))
+HISTORY_MAX_TOKENS = int(os.environ.get("HISTORY_MAX_TOKENS", 6000))
+HISTORY_CACHE_SIZE = 256        # conversations with a cached summary
+TOKEN_CACHE_SIZE = 10000        # messages with a cached token count
+MESSAGE_OVERHEAD_TOKENS = 4     # role and separators
+
+SUMMARY_PROMPT = """Summarize the conversation below for an assistant that will continue it.
+Keep the user's goals, the facts and figures found, names, identifiers, queries that worked and open questions.
+Drop greetings and reasoning that led nowhere. If there is an earlier summary, merge it in.
+Answer with the summary only."""
+
+_encoding = None
+
+
+def _encode_len(text):
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:  # the encoding is downloaded on first use
+            logging.warning(f"Estimating tokens from length, no tiktoken encoding: {e}")
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def message_text(message):
+    text = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        text += json.dumps([{"name": call["name"], "args": call["args"]} for call in tool_calls])
+    return text
+
+
+# Starts of the turns in messages, the index of each human message
+def turn_starts(messages):
+    return [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+
+
+class HistoryManager:
+    def __init__(self, keep_turns=HISTORY_KEEP_TURNS, max_tokens=HISTORY_MAX_TOKENS):
+        self.keep_turns = max(keep_turns, 1)
+        self.max_tokens = max_tokens
+        self.lock = threading.Lock()
+        self.token_counts = OrderedDict()  # message id -> tokens
+        # id of a conversation's first message -> (id of the last message summarized, summary)
+        self.summaries = OrderedDict()
+        self.summarized = 0  # LLM calls made to summarize
+
+    def count_tokens(self, message):
+        if message.id is None:
+            return _encode_len(message_text(message)) + MESSAGE_OVERHEAD_TOKENS
+        with self.lock:
+            tokens = self.token_counts.get(message.id)
+        if tokens is None:
+            tokens = _encode_len(message_text(message)) + MESSAGE_OVERHEAD_TOKENS
+            with self.lock:
+                self.token_counts[message.id] = tokens
+                while len(self.token_counts) > TOKEN_CACHE_SIZE:
+                    self.token_counts.popitem(last=False)
+        return tokens
+
+    def total_tokens(self, messages):
+        return sum(self.count_tokens(message) for message in messages)
+
+    def _summarize(self, llm, summary, messages):
+        transcript = "\n".join(f"{message.type}: {message_text(message)}" for message in messages)
+        if summary:
+            transcript = f"Earlier summary:\n{summary}\n\nConversation:\n{transcript}"
+        self.summarized += 1
+        # Runs inside the calling node. The tag keeps its tokens out of the
+        # node's stream_mode="messages" output.
+        summarizer = llm.with_config(tags=[TAG_NOSTREAM])
+        return summarizer.invoke([SystemMessage(SUMMARY_PROMPT), HumanMessage(transcript)]).content
+
+    # The messages to send in place of messages. llm writes the summary.
+    def trim(self, messages, llm):
+        prompt_len = 0
+        while prompt_len < len(messages) and isinstance(messages[prompt_len], SystemMessage):
+            prompt_len += 1
+        prompt, history = messages[:prompt_len], messages[prompt_len:]
+        if not history:
+            return messages
+        key = history[0].id
+
+        # Messages after the cached summary, all of them if there is none
+        start, summary = 0, None
+        with self.lock:
+            cached = self.summaries.get(key) if key is not None else None
+        if cached is not None:
+            last_id, cached_summary = cached
+            ids = [message.id for message in history]
+            if last_id in ids:
+                start, summary = ids.index(last_id) + 1, cached_summary
+
+        budget = self.max_tokens - self.total_tokens(prompt)
+        summary_tokens = _encode_len(summary) if summary else 0
+        starts = [i for i in turn_starts(history) if i >= start]
+        if len(starts) <= 2 * self.keep_turns \
+           and self.total_tokens(history[start:]) + summary_tokens <= budget:
+            return self._with_summary(prompt, summary, history[start:])
+
+        # Stale: summarize all but the last keep_turns turns. Those get at
+        # most half the budget, leaving room to grow until the next summary,
+        # but the last turn is always kept.
+        if not starts:
+            return self._with_summary(prompt, summary, history[start:])
+        kept = starts[-self.keep_turns:]
+        while len(kept) > 1 and self.total_tokens(history[kept[0]:]) > budget // 2:
+            kept = kept[1:]
+        cut = kept[0]
+        if cut <= start:
+            return self._with_summary(prompt, summary, history[start:])
+        try:
+            summary = self._summarize(llm, summary, history[start:cut])
+        except Exception as e:
+            logging.error(f"Could not summarize history, sending the last turns only: {e}")
+            return prompt + history[cut:]
+        if key is not None and history[cut - 1].id is not None:
+            with self.lock:
+                self.summaries[key] = (history[cut - 1].id, summary)
+                self.summaries.move_to_end(key)
+                while len(self.summaries) > HISTORY_CACHE_SIZE:
+                    self.summaries.popitem(last=False)
+        logging.info(f"Summarized {cut - start} messages, keeping {len(history) - cut}.")
+        return self._with_summary(prompt, summary, history[cut:])
+
+    def _with_summary(self, prompt, summary, recent):
+        if not summary:
+            return prompt + recent
+        return prompt + [SystemMessage(f"Summary of the earlier conversation:\n{summary}")] + recent
+
+    def stats(self):
+        with self.lock:
+            return {
+                "conversations": len(self.summaries),
+                "counted_messages": len(self.token_counts),
+                "summarized": self.summarized,
+            }
@@ -1,35 +1,247 @@
 #!/usr/bin/python3
 
+import base64
 import json
 import logging
+import os
+import threading
+import time
 import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote
+from urllib3.util.retry import Retry
 
 # ConjurRetrieverJwt ============================================
 AUTHN_JWT_HEADERS = { "Content-Type": "application/x-www-form-urlencoded",
     		          "Accept-Encoding": "base64"
 		            }
+CONJUR_TOKEN_TTL_SECS = 8 * 60      # Conjur access tokens are good for 8 minutes
+TOKEN_REFRESH_MARGIN_SECS = 60      # refresh tokens this long before they expire
+
+# Conjur tokens are base64'd JSON whose "payload" field is a base64url'd
+# claims object. Fall back to the documented lifetime if it can't be read.
+def tokenExpiry(conjur_token: str) -> float:
+  try:
+    token = json.loads(base64.b64decode(conjur_token))
+    payload = token["payload"]
+    claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    return float(claims["exp"])
+  except Exception:
+    logging.debug("Could not read token expiry, assuming default lifetime.")
+    return time.time() + CONJUR_TOKEN_TTL_SECS
+
+# Pooled HTTP sessions ============================================
+HTTP_POOL_SIZE = 10                 # keep-alive connections kept per host
+HTTP_TIMEOUT_SECS = (3.05, 10)      # (connect, read)
+HTTP_MAX_RETRIES = 3                # connection errors and 429/5xx responses
+HTTP_BACKOFF_SECS = 0.3             # exponential backoff factor between retries
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+  # requests has no session-wide timeout, so apply a default per adapter
+  def __init__(self, timeout, **kwargs):
+    self.timeout = timeout
+    super().__init__(**kwargs)
+
+  def send(self, request, **kwargs):
+    if kwargs.get("timeout") is None:
+      kwargs["timeout"] = self.timeout
+    return super().send(request, **kwargs)
+
+# Returns a requests.Session that keeps connections (and their TLS sessions)
+# alive between calls, with default timeouts and bounded retry with backoff.
+def newHttpSession(pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT_SECS,
+                   max_retries=HTTP_MAX_RETRIES, backoff=HTTP_BACKOFF_SECS) -> requests.Session:
+  retry = Retry(total=max_retries, backoff_factor=backoff,
+                status_forcelist=HTTP_RETRY_STATUSES,
+                allowed_methods=frozenset({"GET", "POST"}),
+                raise_on_status=False)
+  adapter = _TimeoutHTTPAdapter(timeout, pool_connections=pool_size,
+                                pool_maxsize=pool_size, max_retries=retry)
+  session = requests.Session()
+  session.mount("https://", adapter)
+  session.mount("http://", adapter)
+  return session
+
+_sharedSession = None
+_sharedSessionLock = threading.Lock()
+
+# Process-wide session shared by the retriever and the JWT providers
+def getHttpSession() -> requests.Session:
+  global _sharedSession
+  with _sharedSessionLock:
+    if _sharedSession is None:
+      _sharedSession = newHttpSession()
+    return _sharedSession
+
+class _InFlight:
+  # One pending call that concurrent callers wait on instead of repeating it
+  def __init__(self):
+    self.done = threading.Event()
+    self.result = None
+    self.error = None
+
+class _SingleFlight:
+  # Runs fn() once per key at a time; concurrent callers with the same key share the outcome
+
+  def __init__(self):
+    self.__private_lock = threading.Lock()
+    self.__private_calls = {}
+
+  def do(self, key, fn):
+    with self.__private_lock:
+      call = self.__private_calls.get(key)
+      leader = call is None
+      if leader:
+        call = _InFlight()
+        self.__private_calls[key] = call
+    if not leader:
+      call.done.wait()
+    else:
+      try:
+        call.result = fn()
+      except Exception as e:
+        call.error = e
+      finally:
+        with self.__private_lock:
+          del self.__private_calls[key]
+        call.done.set()
+    if call.error is not None:
+      raise call.error
+    return call.result
+
+# ServiceAccountJwtProvider ============================================
+SERVICE_ACCOUNT_TOKEN_PATH = "/run/secrets/kubernetes.io/serviceaccount/token"
+JWT_REFRESH_MARGIN_SECS = 60        # re-read the file this long before exp
+
+# Seconds-since-epoch "exp" claim of a JWT, or None if it has none
+def jwtExpiry(jwt: str):
+  try:
+    payload = jwt.split(".")[1]
+    claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    return float(claims["exp"])
+  except Exception:
+    logging.debug("Could not read JWT expiry.")
+    return None
+
+class ServiceAccountJwtProvider:
+  # jwtProvider for pods: hands out the Kubernetes service account token.
+  # The token is kept in memory and the file re-read only when its mtime,
+  # inode or size changes (the kubelet swaps in a new file on rotation), or
+  # when the token is within refresh_margin of its exp.
+
+  def __init__(self, token_path=SERVICE_ACCOUNT_TOKEN_PATH,
+                refresh_margin=JWT_REFRESH_MARGIN_SECS):
+    self.token_path = token_path
+    self.refresh_margin = refresh_margin
+    self.__private_lock = threading.Lock()
+    self.__private_jwt = None
+    self.__private_expiresAt = None
+    self.__private_fileId = None
+
+  # Private ============================================
+
+  def __private_stale(self, file_id) -> bool:
+    if self.__private_jwt is None or file_id != self.__private_fileId:
+      return True
+    return self.__private_expiresAt is not None \
+             and time.time() >= self.__private_expiresAt - self.refresh_margin
+
+  # Public ============================================
+
+  def __call__(self, workload_id: str) -> str:
+    with self.__private_lock:
+      st = os.stat(self.token_path)
+      file_id = (st.st_mtime_ns, st.st_ino, st.st_size)
+      if self.__private_stale(file_id):
+        logging.info(f"Reading service account token from {self.token_path}")
+        with open(self.token_path, 'r') as file:
+          self.__private_jwt = file.read().strip()
+        self.__private_expiresAt = jwtExpiry(self.__private_jwt)
+        self.__private_fileId = file_id
+        logging.debug(f"JWT: {self.__private_jwt}")
+      return self.__private_jwt
+
+# Metrics hooks ============================================
+
+class RetrieverMetrics:
+  # Hooks the retrievers call as they work. Stages are "idp_jwt",
+  # "conjur_authn", "secret_get" and "secrets_batch_get". These defaults
+  # do nothing; subclass to feed a metrics system.
+
+  def observeStage(self, stage: str, seconds: float):
+    pass
+
+  # status is the HTTP status code, or "error" if no response came back
+  def upstreamError(self, stage: str, status: str):
+    pass
+
+  def cacheLookup(self, cache: str, hit: bool):
+    pass
+
+class _StageResult:
+  def __init__(self):
+    self.status = None
+
+# Time the body as one stage. Set .status on the yielded object to the
+# response status code so failed responses are counted as upstream errors.
+@contextmanager
+def timedStage(metrics: RetrieverMetrics, stage: str):
+  result = _StageResult()
+  start = time.perf_counter()
+  try:
+    yield result
+  except Exception:
+    if result.status is None:
+      result.status = "error"
+    raise
+  finally:
+    metrics.observeStage(stage, time.perf_counter() - start)
+    if result.status == "error" or (result.status or 0) >= 400:
+      metrics.upstreamError(stage, str(result.status))
+
+class _CachedToken:
+  def __init__(self, token: str, expires_at: float):
+    self.token = token
+    self.expires_at = expires_at    # wall clock, seconds since epoch
+    self.used = False               # read since it was minted?
+    self.timer = None
 
 class ConjurRetrieverJwt:
 
-  def __init__(self, cybr_tenant_subdomain, authn_jwt_id, jwtProvider):
+  def __init__(self, cybr_tenant_subdomain, authn_jwt_id, jwtProvider,
+                refresh_margin=TOKEN_REFRESH_MARGIN_SECS, session=None, metrics=None,
+                conjur_url=None):
     self.__private_jwtProvider = jwtProvider
-    self.conjur_url = f"https://{cybr_tenant_subdomain}.secretsmgr.cyberark.cloud/api"
+    self.__private_session = session if session is not None else getHttpSession()
+    self.metrics = metrics if metrics is not None else RetrieverMetrics()
+    # conjur_url overrides the Conjur Cloud API URL, e.g. to point at a test double
+    self.conjur_url = conjur_url or f"https://{cybr_tenant_subdomain}.secretsmgr.cyberark.cloud/api"
     self.conjur_authn_url = f"{self.conjur_url}/authn-jwt/{authn_jwt_id}/conjur/authenticate"
+    self.refresh_margin = refresh_margin
+    self.__private_tokens = {}      # workload_id -> _CachedToken
+    self.__private_tokensLock = threading.Lock()
+    self.__private_authnFlight = _SingleFlight()
+    self.__private_fetchFlight = _SingleFlight()
 
   # Private ============================================
 
   def __private_getJwt(self, workload_id: str) -> str:
     logging.info(f"Getting JWT from IDP for workload ID {workload_id}...")
-    
-    jwt = self.__private_jwtProvider(workload_id)
+
+    with timedStage(self.metrics, "idp_jwt"):
+      jwt = self.__private_jwtProvider(workload_id)
     return jwt
 
   def __private_authnJwt(self, workload_id: str) -> str:
     jwt = self.__private_getJwt(workload_id)
     logging.info("Authenticating to Conjur Cloud...")
     payload = f"jwt={jwt}"
-    resp = requests.request("POST", self.conjur_authn_url,
-			                headers=AUTHN_JWT_HEADERS, data=payload)
+    with timedStage(self.metrics, "conjur_authn") as stage:
+      resp = self.__private_session.request("POST", self.conjur_authn_url,
+			                  headers=AUTHN_JWT_HEADERS, data=payload)
+      stage.status = resp.status_code
     if resp:
       conjur_token = resp.text
       logging.info("Authentication succeeded.")
@@ -38,16 +250,90 @@ class ConjurRetrieverJwt:
       raise RuntimeError(f"Authentication failed. HTTPS status code: {resp.status_code}")
     return conjur_token
 
-  # Public ============================================
+  # Authenticate and cache the new token. Only one authentication per
+  # workload ID is in flight at a time; other callers wait for its result.
+  def __private_authenticate(self, workload_id: str) -> _CachedToken:
+    def authn():
+      conjur_token = self.__private_authnJwt(workload_id)
+      cached = _CachedToken(conjur_token, tokenExpiry(conjur_token))
+      self.__private_storeToken(workload_id, cached)
+      return cached
+    return self.__private_authnFlight.do(workload_id, authn)
 
-  def getSecret(self, secret_id: str, workload_id: str) -> str:
-    conjur_token = self.__private_authnJwt(workload_id)
-    logging.info(f"Retrieving secret: {secret_id}")
-    secrets_url = f"{self.conjur_url}/secrets/conjur/variable/{secret_id}"
+  def __private_storeToken(self, workload_id: str, cached: _CachedToken):
+    delay = max(0, cached.expires_at - self.refresh_margin - time.time())
+    cached.timer = threading.Timer(delay, self.__private_refresh,
+                                    args=(workload_id, cached))
+    cached.timer.daemon = True
+    with self.__private_tokensLock:
+      old = self.__private_tokens.get(workload_id)
+      self.__private_tokens[workload_id] = cached
+    if old is not None and old.timer is not None:
+      old.timer.cancel()
+    cached.timer.start()
+
+  # Background refresh, runs shortly before a token expires. Tokens nobody
+  # read since they were minted are dropped rather than renewed forever.
+  def __private_refresh(self, workload_id: str, cached: _CachedToken):
+    with self.__private_tokensLock:
+      if self.__private_tokens.get(workload_id) is not cached:
+        return
+      if not cached.used:
+        logging.info(f"Dropping idle Conjur token for workload ID {workload_id}.")
+        del self.__private_tokens[workload_id]
+        return
+    logging.info(f"Refreshing Conjur token for workload ID {workload_id}...")
+    try:
+      self.__private_authenticate(workload_id)
+    except Exception as e:
+      # the current token stays usable until it expires
+      logging.error(f"Token refresh failed: {e}")
+
+  def __private_getToken(self, workload_id: str) -> str:
+    with self.__private_tokensLock:
+      cached = self.__private_tokens.get(workload_id)
+      if cached is not None and time.time() < cached.expires_at:
+        cached.used = True
+        self.metrics.cacheLookup("token", True)
+        return cached.token
+    self.metrics.cacheLookup("token", False)
+    cached = self.__private_authenticate(workload_id)
+    cached.used = True
+    return cached.token
+
+  def __private_dropToken(self, workload_id: str, conjur_token: str):
+    with self.__private_tokensLock:
+      cached = self.__private_tokens.get(workload_id)
+      if cached is None or cached.token != conjur_token:
+        return
+      del self.__private_tokens[workload_id]
+    if cached.timer is not None:
+      cached.timer.cancel()
+
+  # GET a Conjur resource with the workload's token, re-authenticating once
+  # if the cached token was revoked or expired early.
+  def __private_get(self, url: str, workload_id: str, stage_name: str):
+    conjur_token = self.__private_getToken(workload_id)
     access_headers = { "Content-Type": "application/json",
         		   "Authorization": f"Token token=\"{conjur_token}\""
 		 }
-    resp = requests.request("GET", secrets_url, headers=access_headers)
+    with timedStage(self.metrics, stage_name) as stage:
+      resp = self.__private_session.request("GET", url, headers=access_headers)
+      stage.status = resp.status_code
+    if resp.status_code == 401:
+      logging.info("Conjur token rejected, re-authenticating...")
+      self.__private_dropToken(workload_id, conjur_token)
+      conjur_token = self.__private_getToken(workload_id)
+      access_headers["Authorization"] = f"Token token=\"{conjur_token}\""
+      with timedStage(self.metrics, stage_name) as stage:
+        resp = self.__private_session.request("GET", url, headers=access_headers)
+        stage.status = resp.status_code
+    return resp
+
+  def __private_fetchSecret(self, secret_id: str, workload_id: str) -> str:
+    logging.info(f"Retrieving secret: {secret_id}")
+    secrets_url = f"{self.conjur_url}/secrets/conjur/variable/{secret_id}"
+    resp = self.__private_get(secrets_url, workload_id, "secret_get")
     secret_value = ""
     if resp:
       secret_value = resp.text
@@ -55,6 +341,48 @@ class ConjurRetrieverJwt:
       logging.debug(f"Secret retrieved: {secret_value}")
     else:
         raise RuntimeError(f"Secret retrieval failed. HTTP status code: {resp.status_code}")
-    return secret_value 
+    return secret_value
+
+  def __private_fetchSecrets(self, secret_ids: list[str], workload_id: str) -> dict[str, str]:
+    logging.info(f"Retrieving secrets: {secret_ids}")
+    resource_ids = {f"conjur:variable:{secret_id}": secret_id for secret_id in secret_ids}
+    variable_ids = ",".join(quote(resource_id, safe=":") for resource_id in resource_ids)
+    secrets_url = f"{self.conjur_url}/secrets?variable_ids={variable_ids}"
+    resp = self.__private_get(secrets_url, workload_id, "secrets_batch_get")
+    if not resp:
+      raise RuntimeError(f"Batch secret retrieval failed. HTTP status code: {resp.status_code}")
+    secret_values = { resource_ids[resource_id]: value
+                      for resource_id, value in resp.json().items() }
+    logging.info("Secrets retrieved successfully.")
+    logging.debug(f"Secrets retrieved: {secret_values}")
+    return secret_values
+
+  # Public ============================================
+
+  # Concurrent requests for the same secret and workload ID share one
+  # upstream call and its result.
+  def getSecret(self, secret_id: str, workload_id: str) -> str:
+    key = ("secret", workload_id, secret_id)
+    return self.__private_fetchFlight.do(
+             key, lambda: self.__private_fetchSecret(secret_id, workload_id))
+
+  # Retrieve several secrets in one round trip. Returns a dict of secret ID
+  # to value. Conjur fails the whole batch if any one variable is missing
+  # or not readable, so callers get all the values or none of them.
+  def getSecrets(self, secret_ids: list[str], workload_id: str) -> dict[str, str]:
+    if not secret_ids:
+      return {}
+    key = ("secrets", workload_id, tuple(sorted(set(secret_ids))))
+    return self.__private_fetchFlight.do(
+             key, lambda: self.__private_fetchSecrets(secret_ids, workload_id))
+
+  # Forget all cached tokens and stop their refresh timers
+  def close(self):
+    with self.__private_tokensLock:
+      tokens = list(self.__private_tokens.values())
+      self.__private_tokens.clear()
+    for cached in tokens:
+      if cached.timer is not None:
+        cached.timer.cancel()
 
 # End ConjurRetrieverJwt ============================================
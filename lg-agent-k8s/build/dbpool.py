@@ -0,0 +1,262 @@
+#!/usr/bin/python3
+
+# SQLAlchemy engines for the agents' MySQL connections, with a configurable
+# connection pool, a warm-up that opens the pool at startup and pool metrics.
+# Settings default to the env vars below, e.g.
+#
+#   MYSQL_POOL_SIZE=10 MYSQL_POOL_RECYCLE_SECS=1800 poetry run python lg-mysql.py
+#
+# Recycling connections before MySQL's wait_timeout (8h by default, often
+# much less in managed servers) and pre-pinging on checkout keeps a
+# long-lived agent from failing on a connection the server already closed.
+#
+# MYSQL_DRIVER picks the DBAPI driver:
+#   mysqlconnector  mysql-connector-python with its C extension (default)
+#   mysqlclient     MySQLdb, C bindings to libmysqlclient (pip install mysqlclient)
+#   asyncmy         async, Cython-accelerated (pip install asyncmy)
+#   aiomysql        async, pure Python (pip install aiomysql)
+# The async drivers need newAsyncEngine(). LangChain's SQLDatabase is
+# synchronous, so syncDriver() maps them to the default driver.
+
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+try:
+  import prometheus_client
+except ImportError:
+  prometheus_client = None
+
+# Pool settings ============================================
+MYSQL_POOL_SIZE = int(os.environ.get("MYSQL_POOL_SIZE", 5))               # connections kept open
+MYSQL_MAX_OVERFLOW = int(os.environ.get("MYSQL_MAX_OVERFLOW", 5))         # extra connections in a burst
+MYSQL_POOL_TIMEOUT_SECS = float(os.environ.get("MYSQL_POOL_TIMEOUT_SECS", 10))  # wait for a free connection
+MYSQL_POOL_RECYCLE_SECS = int(os.environ.get("MYSQL_POOL_RECYCLE_SECS", 3600))  # reopen connections this old
+MYSQL_POOL_PRE_PING = os.environ.get("MYSQL_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+MYSQL_CONNECT_TIMEOUT_SECS = int(os.environ.get("MYSQL_CONNECT_TIMEOUT_SECS", 5))
+MYSQL_POOL_METRICS_PORT = os.environ.get("MYSQL_POOL_METRICS_PORT")     # serve Prometheus metrics here
+
+MYSQL_DRIVER = os.environ.get("MYSQL_DRIVER", "mysqlconnector")
+
+# MYSQL_DRIVER choices -> SQLAlchemy driver name and whether it is async
+MYSQL_DRIVERS = {
+  "mysqlconnector": ("mysqlconnector", False),
+  "mysqlclient": ("mysqldb", False),
+  "asyncmy": ("asyncmy", True),
+  "aiomysql": ("aiomysql", True),
+}
+
+# Name of the connect timeout argument of each DBAPI driver
+DRIVER_CONNECT_TIMEOUT_ARG = {
+  "mysqlconnector": "connection_timeout",
+  "mysqldb": "connect_timeout",
+  "asyncmy": "connect_timeout",
+  "aiomysql": "connect_timeout",
+}
+
+# Extra connect arguments of each DBAPI driver. mysql-connector falls back
+# to pure Python if its C extension isn't built, use_pure=False makes
+# that an error instead.
+DRIVER_CONNECT_ARGS = {
+  "mysqlconnector": { "use_pure": False },
+}
+
+# PoolMetrics ============================================
+
+class PoolMetrics:
+  # Counts pool activity for one engine. stats() returns the counts; with
+  # prometheus_client installed they are also exported as metrics labelled
+  # with the pool name.
+
+  def __init__(self, name="mysql"):
+    self.name = name
+    self.engine = None
+    self.__private_lock = threading.Lock()
+    self.checkouts = 0
+    self.checkins = 0
+    self.connects = 0
+    self.invalidations = 0
+    self.timeouts = 0
+    self.wait_seconds_total = 0.0
+    self.wait_seconds_max = 0.0
+    if prometheus_client is not None:
+      self.__private_prom = _prometheusMetrics()
+    else:
+      self.__private_prom = None
+
+  # Private ============================================
+
+  def __private_count(self, counter: str):
+    with self.__private_lock:
+      setattr(self, counter, getattr(self, counter) + 1)
+    if self.__private_prom is not None:
+      self.__private_prom["events"].labels(self.name, counter).inc()
+
+  # Public ============================================
+
+  # Hooks the pool events of engine
+  def attach(self, engine):
+    self.engine = engine
+    event.listen(engine, "checkout", lambda *args: self.__private_count("checkouts"))
+    event.listen(engine, "checkin", lambda *args: self.__private_count("checkins"))
+    event.listen(engine, "connect", lambda *args: self.__private_count("connects"))
+    event.listen(engine, "invalidate", lambda *args: self.__private_count("invalidations"))
+
+  # Time spent waiting for a connection from the pool, including opening
+  # a new one when none is idle
+  def observeWait(self, seconds: float, timed_out=False):
+    with self.__private_lock:
+      self.wait_seconds_total += seconds
+      self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+    if self.__private_prom is not None:
+      self.__private_prom["wait"].labels(self.name).observe(seconds)
+    if timed_out:
+      self.__private_count("timeouts")
+
+  def stats(self) -> dict:
+    with self.__private_lock:
+      stats = { "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_seconds_avg": self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+                "wait_seconds_max": self.wait_seconds_max, }
+    if self.engine is not None:
+      stats["checked_out"] = self.engine.pool.checkedout()
+      stats["idle"] = self.engine.pool.checkedin()
+    return stats
+
+_promMetrics = None
+
+# Prometheus metrics are process-wide, so every PoolMetrics shares one set
+def _prometheusMetrics() -> dict:
+  global _promMetrics
+  if _promMetrics is None:
+    _promMetrics = {
+      "wait": prometheus_client.Histogram("mysql_pool_wait_seconds",
+                                          "Time spent waiting for a pooled connection",
+                                          ["pool"], buckets=(0.0005, 0.001, 0.005, 0.01, 0.05,
+                                                             0.1, 0.5, 1.0, 5.0, 10.0)),
+      "events": prometheus_client.Counter("mysql_pool_events_total",
+                                          "Pool checkouts, checkins, connects, invalidations and timeouts",
+                                          ["pool", "event"]),
+    }
+  return _promMetrics
+
+# Serves the metrics on port if prometheus_client is installed
+def startMetricsServer(port: int):
+  if prometheus_client is None:
+    logging.warning("prometheus_client is not installed, pool metrics are only logged.")
+    return
+  prometheus_client.start_http_server(port)
+  logging.info(f"Serving pool metrics on port {port}")
+
+# Engine ============================================
+
+def isAsyncDriver(driver=MYSQL_DRIVER) -> bool:
+  if driver not in MYSQL_DRIVERS:
+    raise ValueError(f"Unknown MYSQL_DRIVER {driver}, expected one of {list(MYSQL_DRIVERS)}")
+  return MYSQL_DRIVERS[driver][1]
+
+# driver, or the default driver if it is async, for synchronous callers
+def syncDriver(driver=MYSQL_DRIVER) -> str:
+  if isAsyncDriver(driver):
+    logging.warning(f"{driver} is async, using mysqlconnector for synchronous access.")
+    return "mysqlconnector"
+  return driver
+
+# URL for the MYSQL_DRIVER choice driver. Logging it hides the password.
+def mysqlUri(username: str, password: str, host: str, port: int, database: str,
+             driver=MYSQL_DRIVER) -> URL:
+  isAsyncDriver(driver)
+  return URL.create(f"mysql+{MYSQL_DRIVERS[driver][0]}", username=username, password=password,
+                    host=host, port=int(port), database=database)
+
+def _connectArgs(uri, connect_timeout) -> dict:
+  driver = make_url(uri).get_driver_name()
+  connect_args = dict(DRIVER_CONNECT_ARGS.get(driver, {}))
+  timeout_arg = DRIVER_CONNECT_TIMEOUT_ARG.get(driver)
+  if timeout_arg is not None:
+    connect_args[timeout_arg] = connect_timeout
+  return connect_args
+
+def _timedQueuePool(metrics: PoolMetrics, base=QueuePool):
+  # QueuePool.recreate() builds the new pool from self.__class__, so the
+  # metrics stay attached when the engine is disposed
+  class _TimedQueuePool(base):
+    def _do_get(self):
+      start = time.perf_counter()
+      timed_out = True
+      try:
+        conn = super()._do_get()
+        timed_out = False
+        return conn
+      finally:
+        metrics.observeWait(time.perf_counter() - start, timed_out)
+  return _TimedQueuePool
+
+def newEngine(uri: str, pool_size=MYSQL_POOL_SIZE, max_overflow=MYSQL_MAX_OVERFLOW,
+              pool_timeout=MYSQL_POOL_TIMEOUT_SECS, pool_recycle=MYSQL_POOL_RECYCLE_SECS,
+              pool_pre_ping=MYSQL_POOL_PRE_PING, connect_timeout=MYSQL_CONNECT_TIMEOUT_SECS,
+              metrics=None):
+  metrics = metrics or PoolMetrics()
+  engine = create_engine(uri, poolclass=_timedQueuePool(metrics), pool_size=pool_size,
+                         max_overflow=max_overflow, pool_timeout=pool_timeout,
+                         pool_recycle=pool_recycle, pool_pre_ping=pool_pre_ping,
+                         connect_args=_connectArgs(uri, connect_timeout))
+  metrics.attach(engine)
+  return engine
+
+# Same as newEngine() for the async drivers. Pool events and metrics are
+# those of the engine's sync_engine.
+def newAsyncEngine(uri: str, pool_size=MYSQL_POOL_SIZE, max_overflow=MYSQL_MAX_OVERFLOW,
+                   pool_timeout=MYSQL_POOL_TIMEOUT_SECS, pool_recycle=MYSQL_POOL_RECYCLE_SECS,
+                   pool_pre_ping=MYSQL_POOL_PRE_PING, connect_timeout=MYSQL_CONNECT_TIMEOUT_SECS,
+                   metrics=None):
+  # needs greenlet, which only the async drivers pull in
+  from sqlalchemy.ext.asyncio import create_async_engine
+  metrics = metrics or PoolMetrics()
+  engine = create_async_engine(uri, poolclass=_timedQueuePool(metrics, AsyncAdaptedQueuePool),
+                               pool_size=pool_size, max_overflow=max_overflow,
+                               pool_timeout=pool_timeout, pool_recycle=pool_recycle,
+                               pool_pre_ping=pool_pre_ping,
+                               connect_args=_connectArgs(uri, connect_timeout))
+  metrics.attach(engine.sync_engine)
+  return engine
+
+# Opens that many connections at once and returns them to the pool, so the
+# first requests don't pay for connection setup. Failures are logged: the
+# pool still opens connections on demand.
+def warmPool(engine, connections=MYSQL_POOL_SIZE):
+  opened = []
+  start = time.perf_counter()
+  try:
+    for _ in range(connections):
+      opened.append(engine.connect())
+  except Exception as e:
+    logging.error(f"Pool warm-up stopped after {len(opened)} connections: {e}")
+  finally:
+    for conn in opened:
+      conn.close()
+  logging.info(f"Warmed pool with {len(opened)} connections in {time.perf_counter() - start:.3f}s")
+  return len(opened)
+
+async def warmAsyncPool(engine, connections=MYSQL_POOL_SIZE):
+  opened = []
+  start = time.perf_counter()
+  try:
+    for _ in range(connections):
+      opened.append(await engine.connect())
+  except Exception as e:
+    logging.error(f"Pool warm-up stopped after {len(opened)} connections: {e}")
+  finally:
+    for conn in opened:
+      await conn.close()
+  logging.info(f"Warmed pool with {len(opened)} connections in {time.perf_counter() - start:.3f}s")
+  return len(opened)
@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+
+# HTTP/SSE front end for the petclinic agent. The graph is built once at
+# startup and shared by every conversation. Each conversation is a
+# thread_id in the checkpointer, so clients only send their new message.
+# Conversations are kept in ./checkpoints and survive a restart, see
+# sqlitesaver.py.
+#
+#   poetry run uvicorn lg-server:app --host 0.0.0.0 --port 8080
+#
+#   curl -N localhost:8080/chat/stream -H "Content-Type: application/json" \
+#        -d '{"thread_id": "t1", "message": "How many pets are there?"}'
+
+# Setup logging to new/overwritten logfile with loglevel
+import logging
+from pathlib import Path
+
+Path("./logs").mkdir(parents=True, exist_ok=True)
+logfile = f"./logs/lg-server.log"
+logfmode = 'w'                # w = overwrite, a = append
+# Log levels: NOTSET DEBUG INFO WARN ERROR CRITICAL
+loglevel = logging.INFO
+# Cuidado! DEBUG will leak secrets!
+logging.basicConfig(filename=logfile, encoding='utf-8', level=loglevel, filemode=logfmode)
+
+#----------------------------------------
+# Build the graph once, see mysqlgraph.py
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from sqlitesaver import DeltaSqliteSaver
+import mysqlgraph
+
+graph = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global graph
+    # blocks on Conjur, MySQL and schema introspection, keep it off the loop
+    checkpointer = DeltaSqliteSaver("./checkpoints/lg-server.sqlite")
+    graph = await asyncio.to_thread(mysqlgraph.build_graph, checkpointer)
+    yield
+    checkpointer.close()
+
+app = FastAPI(lifespan=lifespan)
+
+#----------------------------------------
+# Run conversations
+import json
+import uuid
+import weakref
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+# One turn at a time per conversation, so two requests for the same thread
+# don't interleave their messages. Locks go away with their last request.
+threadLocks = weakref.WeakValueDictionary()
+
+def thread_lock(thread_id: str) -> asyncio.Lock:
+    lock = threadLocks.get(thread_id)
+    if lock is None:
+      lock = threadLocks[thread_id] = asyncio.Lock()
+    return lock
+
+class ChatRequest(BaseModel):
+  message: str
+  thread_id: str | None = None     # a new conversation if not given
+
+def message_event(node: str, message) -> dict:
+    event = { "node": node, "type": message.type, "content": message.content }
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+      event["tool_calls"] = [ call["name"] for call in tool_calls ]
+    return event
+
+# Yields (event type, data) for one turn of a conversation: token,
+# tool_start and tool_end as they happen (see mysqlgraph.turn_events), and
+# an update for each message a node adds
+async def run_turn(thread_id: str, message: str):
+    config = { "configurable": { "thread_id": thread_id } }
+    async with thread_lock(thread_id):
+      async for chunk in graph.astream({ "messages": [("user", message)] }, config,
+                                       stream_mode=mysqlgraph.STREAM_MODES):
+        logging.debug(f"chunk: {chunk}")
+        for kind, data in mysqlgraph.turn_events(chunk):
+          yield kind, data
+        mode, update = chunk
+        if mode == "updates":
+          for node, value in update.items():
+            for msg in (value or {}).get("messages", []):
+              yield "update", message_event(node, msg)
+
+@app.post("/chat")
+async def chat(req: ChatRequest) -> dict:
+    thread_id = req.thread_id or str(uuid.uuid4())
+    answer = ""
+    async for kind, data in run_turn(thread_id, req.message):
+      if kind == "update" and data["type"] == "ai" and data["content"]:
+        answer = data["content"]
+    return { "thread_id": thread_id, "answer": answer }
+
+def sse(kind: str, data: dict) -> str:
+    return f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+
+# Server-sent events: thread, then the turn's token, tool_start, tool_end
+# and update events, then done (or error)
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest) -> StreamingResponse:
+    thread_id = req.thread_id or str(uuid.uuid4())
+
+    async def events():
+      yield sse("thread", { "thread_id": thread_id })
+      try:
+        async for kind, data in run_turn(thread_id, req.message):
+          yield sse(kind, data)
+        yield sse("done", {})
+      except Exception as e:
+        logging.error(f"Thread {thread_id} failed: {e}")
+        yield sse("error", { "error": str(e) })
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/health")
+async def health() -> dict:
+    return { "ready": graph is not None }
@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+
+# Cache of SQL agent query results, keyed by database and normalized SQL,
+# so a repeated question is answered without a round trip to MySQL. Only
+# SELECT/WITH statements are cached; DML is forbidden by the agent prompt
+# and never reaches the cache.
+#
+# Entries expire after a TTL. With table tracking on, the cache also polls
+# information_schema.TABLES.UPDATE_TIME every table_check_secs and drops
+# the entries that read a table that has been written since.
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+try:
+  import prometheus_client
+except ImportError:
+  prometheus_client = None
+
+# QueryCache ============================================
+QUERY_CACHE_TTL_SECS = int(os.environ.get("QUERY_CACHE_TTL_SECS", 300))
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", 256))
+QUERY_CACHE_TABLE_CHECK_SECS = float(os.environ.get("QUERY_CACHE_TABLE_CHECK_SECS", 5))  # 0 turns tracking off
+
+_STRING = r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\""
+_LITERAL = re.compile(f"({_STRING}|`[^`]*`)")
+# MySQL only starts a -- comment when whitespace follows, "a--1" is a - -1.
+# It runs /*! */ and /*+ */ comments, so those are part of the query.
+_COMMENT = re.compile(r"--(?=\s|$)[^\n]*|#[^\n]*|/\*(?![!+]).*?\*/", re.DOTALL)
+_KEYWORD = re.compile(r"\b(select|distinct|from|where|and|or|not|in|is|null|like|between|"
+                      r"join|inner|left|right|outer|cross|on|using|as|group|order|by|having|"
+                      r"limit|offset|asc|desc|union|all|with|case|when|then|else|end|"
+                      r"count|sum|avg|min|max)\b", re.IGNORECASE)
+_TABLE_NAME = r"(`[^`]+`|\w+)(?:\s*\.\s*(`[^`]+`|\w+))?"
+_TABLE_REF = re.compile(rf"\b(?:from|join)\s+{_TABLE_NAME}", re.IGNORECASE)
+# ", next_table" after a table and its optional alias, as in FROM a x, b AS y
+_NEXT_TABLE = re.compile(rf"(?:\s+(?:as\s+)?(?:`[^`]+`|\w+))?\s*,\s*{_TABLE_NAME}", re.IGNORECASE)
+
+TABLE_UPDATE_TIMES_SQL = text("""
+  SELECT TABLE_NAME, UPDATE_TIME FROM information_schema.TABLES
+   WHERE TABLE_SCHEMA = :database
+""")
+
+# Same text for queries that only differ in whitespace, comments, keyword
+# case or a trailing semicolon. String literals and quoted names are kept.
+def normalizeSql(sql: str) -> str:
+  parts = _LITERAL.split(sql.strip())
+  normalized = []
+  for i, part in enumerate(parts):
+    if i % 2:
+      normalized.append(part)
+    else:
+      part = _COMMENT.sub(" ", part)
+      part = _KEYWORD.sub(lambda m: m.group(1).lower(), part)
+      normalized.append(re.sub(r"\s+", " ", part))
+  return "".join(normalized).strip().rstrip(";").strip()
+
+# Names of the tables a query reads, as far as a FROM/JOIN scan can tell
+def referencedTables(sql: str) -> set[str]:
+  sql = _COMMENT.sub(" ", re.sub(_STRING, "''", sql))
+  tables = set()
+  for match in _TABLE_REF.finditer(sql):
+    while match:
+      first, second = match.groups()
+      tables.add((second or first).strip("`"))
+      match = _NEXT_TABLE.match(sql, match.end())
+  return tables
+
+def isCacheable(sql: str) -> bool:
+  return normalizeSql(sql).split(" ", 1)[0].lower() in ("select", "with")
+
+class _Entry:
+  def __init__(self, value: str, expires_at: float, tables: set[str]):
+    self.value = value
+    self.expires_at = expires_at
+    self.tables = tables
+
+class QueryCache:
+
+  def __init__(self, engine=None, ttl=QUERY_CACHE_TTL_SECS, max_entries=QUERY_CACHE_MAX_ENTRIES,
+                table_check_secs=QUERY_CACHE_TABLE_CHECK_SECS):
+    self.ttl = ttl
+    self.max_entries = max_entries
+    # UPDATE_TIME is MySQL's, tracking needs an engine to read it with
+    self.engine = engine if engine is not None and engine.dialect.name == "mysql" else None
+    self.table_check_secs = table_check_secs
+    self.__private_entries = OrderedDict()
+    self.__private_lock = threading.Lock()
+    self.__private_updateTimes = {}     # database -> { table: UPDATE_TIME }
+    self.__private_lastCheck = {}       # database -> time.monotonic() of last check
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.invalidations = 0
+    if prometheus_client is not None:
+      self.__private_lookups = _prometheusLookups()
+    else:
+      self.__private_lookups = None
+
+  # Private ============================================
+
+  def __private_tableUpdateTimes(self, database: str) -> dict:
+    with self.engine.connect() as conn:
+      try:
+        # MySQL 8 caches information_schema table stats for a day by default
+        conn.exec_driver_sql("SET SESSION information_schema_stats_expiry = 0")
+      except Exception:
+        logging.debug("information_schema_stats_expiry not supported.")
+      return { row[0]: row[1] for row in conn.execute(TABLE_UPDATE_TIMES_SQL,
+                                                      { "database": database }) }
+
+  # Drop entries for tables written since the last check, at most every
+  # table_check_secs. A failed check leaves the cache alone.
+  def __private_checkTables(self, database: str):
+    if self.engine is None or not self.table_check_secs:
+      return
+    now = time.monotonic()
+    with self.__private_lock:
+      if now - self.__private_lastCheck.get(database, float("-inf")) < self.table_check_secs:
+        return
+      self.__private_lastCheck[database] = now
+    try:
+      update_times = self.__private_tableUpdateTimes(database)
+    except Exception as e:
+      logging.error(f"Could not check table update times: {e}")
+      return
+    with self.__private_lock:
+      previous = self.__private_updateTimes.get(database)
+      self.__private_updateTimes[database] = update_times
+      if previous is None:
+        return
+      changed = { table for table, updated in update_times.items()
+                  if previous.get(table) != updated }
+      if changed:
+        self.__private_invalidate(database, changed)
+
+  def __private_invalidate(self, database: str, tables) -> int:
+    keys = [ key for key, entry in self.__private_entries.items()
+             if key[0] == database and (tables is None or entry.tables & tables) ]
+    for key in keys:
+      del self.__private_entries[key]
+    self.invalidations += len(keys)
+    if keys:
+      logging.info(f"Invalidated {len(keys)} cached query results in {database}.")
+    return len(keys)
+
+  def __private_count(self, hit: bool):
+    if hit:
+      self.hits += 1
+    else:
+      self.misses += 1
+    if self.__private_lookups is not None:
+      self.__private_lookups.labels("hit" if hit else "miss").inc()
+
+  # Public ============================================
+
+  def get(self, database: str, sql: str):
+    self.__private_checkTables(database)
+    key = (database, normalizeSql(sql))
+    with self.__private_lock:
+      entry = self.__private_entries.get(key)
+      if entry is not None and time.monotonic() >= entry.expires_at:
+        del self.__private_entries[key]
+        entry = None
+      self.__private_count(entry is not None)
+      if entry is None:
+        return None
+      self.__private_entries.move_to_end(key)
+      return entry.value
+
+  def put(self, database: str, sql: str, value: str):
+    if not isCacheable(sql):
+      return
+    key = (database, normalizeSql(sql))
+    with self.__private_lock:
+      self.__private_entries[key] = _Entry(value, time.monotonic() + self.ttl,
+                                           referencedTables(sql))
+      self.__private_entries.move_to_end(key)
+      while len(self.__private_entries) > self.max_entries:
+        self.__private_entries.popitem(last=False)
+        self.evictions += 1
+
+  # Drop the entries of database that read any of tables, or all of them
+  def invalidate(self, database: str, tables=None) -> int:
+    with self.__private_lock:
+      return self.__private_invalidate(database, set(tables) if tables is not None else None)
+
+  def stats(self) -> dict:
+    with self.__private_lock:
+      lookups = self.hits + self.misses
+      return { "entries": len(self.__private_entries),
+               "max_entries": self.max_entries,
+               "ttl_secs": self.ttl,
+               "hits": self.hits,
+               "misses": self.misses,
+               "hit_ratio": self.hits / lookups if lookups else 0.0,
+               "evictions": self.evictions,
+               "invalidations": self.invalidations, }
+
+_promLookups = None
+
+def _prometheusLookups():
+  global _promLookups
+  if _promLookups is None:
+    _promLookups = prometheus_client.Counter("sql_query_cache_lookups_total",
+                                             "SQL query result cache lookups by result",
+                                             ["result"])
+  return _promLookups
+
+# End QueryCache ============================================
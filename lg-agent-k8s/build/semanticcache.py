@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+
+# Maps questions to the SQL that answered them, so a near-duplicate of an
+# earlier question runs that query directly instead of going through the
+# SQL agent's LLM loop. Questions are compared by the cosine similarity of
+# their embeddings. Entries are kept per database schema fingerprint (see
+# schemacache.py): when the schema changes, earlier SQL is not reused.
+# They are saved to disk every SEMANTIC_CACHE_SAVE_SECS and at exit.
+#
+# Embeddings can't tell "pets of owner Franklin" from "pets of owner Davis",
+# so a question only matches one with the same literals: numbers, quoted
+# strings and capitalized words past the first.
+
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+# SemanticCache ============================================
+SEMANTIC_CACHE_DIR = os.environ.get("SEMANTIC_CACHE_DIR", "./semantic-cache")
+SEMANTIC_CACHE_MIN_SIMILARITY = float(os.environ.get("SEMANTIC_CACHE_MIN_SIMILARITY", 0.95))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", 500))
+SEMANTIC_CACHE_SAVE_SECS = float(os.environ.get("SEMANTIC_CACHE_SAVE_SECS", 30))
+EMBEDDING_MEMO_SIZE = 64            # recent question embeddings, so store() reuses lookup()'s
+
+_QUOTED = re.compile(r"\"([^\"]*)\"|'([^']*)'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_CAPITALIZED = re.compile(r"(?<![.?!]\s)(?<!^)\b[A-Z][\w'-]*")
+
+# Values a question is about, which its SQL probably filters on
+def questionLiterals(question: str) -> list[str]:
+  quoted = [ a or b for a, b in _QUOTED.findall(question) ]
+  rest = _QUOTED.sub(" ", question).strip()
+  return sorted(set(quoted + _NUMBER.findall(rest) + _CAPITALIZED.findall(rest)))
+
+# SQL of the last sql_db_query call that didn't fail, from the agent's
+# intermediate steps
+def lastValidatedQuery(intermediate_steps) -> str | None:
+  for action, observation in reversed(intermediate_steps or []):
+    if action.tool != "sql_db_query" or str(observation).startswith("Error"):
+      continue
+    tool_input = action.tool_input
+    return tool_input.get("query") if isinstance(tool_input, dict) else str(tool_input)
+  return None
+
+class SemanticCache:
+
+  def __init__(self, embeddings, database: str, fingerprint: str, cache_dir=SEMANTIC_CACHE_DIR,
+                min_similarity=SEMANTIC_CACHE_MIN_SIMILARITY,
+                max_entries=SEMANTIC_CACHE_MAX_ENTRIES, save_secs=SEMANTIC_CACHE_SAVE_SECS):
+    self.embeddings = embeddings
+    self.min_similarity = min_similarity
+    self.max_entries = max(max_entries, 1)
+    self.save_secs = save_secs
+    self.path = Path(cache_dir) / f"{database}-{fingerprint[:16]}.json"
+    self.__private_lock = threading.Lock()
+    self.__private_memo = OrderedDict()   # question -> unit vector
+    # question -> { "sql", "literals", "row" }, least recently used first
+    self.__private_entries = OrderedDict()
+    # Row i of the matrix is the vector of questions[i]. An evicted entry's
+    # row is reused, so rows never move.
+    self.__private_questions = []
+    self.__private_matrix = None
+    self.__private_dirty = False
+    self.hits = 0
+    self.misses = 0
+    self.__private_read()
+    # Stores are saved every save_secs, off the request path, and at exit
+    threading.Thread(target=self.__private_saveLoop, name="semantic-cache-save",
+                     daemon=True).start()
+    atexit.register(self.save)
+
+  # Private ============================================
+
+  def __private_read(self):
+    try:
+      with open(self.path) as f:
+        for entry in json.load(f)[-self.max_entries:]:
+          self.__private_put(entry["question"], entry["sql"], entry["literals"],
+                             np.asarray(entry["vector"], dtype=np.float32))
+    except FileNotFoundError:
+      pass
+    except Exception as e:
+      logging.warning(f"Ignoring unreadable semantic cache {self.path}: {e}")
+      self.__private_entries.clear()
+      self.__private_questions = []
+      self.__private_matrix = None
+
+  # Caller holds the lock
+  def __private_put(self, question: str, sql: str, literals: list[str], vector: np.ndarray):
+    if self.__private_matrix is None:
+      self.__private_matrix = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+    entry = self.__private_entries.pop(question, None)
+    if entry is not None:
+      row = entry["row"]
+    elif len(self.__private_entries) < self.max_entries:
+      row = len(self.__private_questions)
+      self.__private_questions.append(question)
+    else:
+      _, evicted = self.__private_entries.popitem(last=False)
+      row = evicted["row"]
+      self.__private_questions[row] = question
+    self.__private_matrix[row] = vector
+    self.__private_entries[question] = { "sql": sql, "literals": literals, "row": row }
+
+  def __private_saveLoop(self):
+    while True:
+      time.sleep(self.save_secs)
+      self.save()
+
+  def __private_embed(self, question: str) -> np.ndarray:
+    with self.__private_lock:
+      vector = self.__private_memo.get(question)
+    if vector is None:
+      vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+      vector /= np.linalg.norm(vector) or 1.0
+      with self.__private_lock:
+        self.__private_memo[question] = vector
+        while len(self.__private_memo) > EMBEDDING_MEMO_SIZE:
+          self.__private_memo.popitem(last=False)
+    return vector
+
+  # Public ============================================
+
+  # SQL that answered a question like this one, or None
+  def lookup(self, question: str) -> str | None:
+    vector = self.__private_embed(question)
+    literals = questionLiterals(question)
+    with self.__private_lock:
+      best = None
+      if self.__private_questions:
+        similarities = self.__private_matrix[:len(self.__private_questions)] @ vector
+        for i in np.argsort(-similarities):
+          if similarities[i] < self.min_similarity:
+            break
+          candidate = self.__private_questions[i]
+          if self.__private_entries[candidate]["literals"] == literals:
+            best = candidate
+            break
+      if best is None:
+        self.misses += 1
+        return None
+      self.hits += 1
+      self.__private_entries.move_to_end(best)
+      logging.info(f"Semantic cache hit: {question!r} is like {best!r}")
+      return self.__private_entries[best]["sql"]
+
+  # Remember that sql answered question
+  def store(self, question: str, sql: str):
+    vector = self.__private_embed(question)
+    with self.__private_lock:
+      self.__private_put(question, sql, questionLiterals(question), vector)
+      self.__private_dirty = True
+
+  # Writes the entries to disk if they changed since the last save
+  def save(self):
+    with self.__private_lock:
+      if not self.__private_dirty:
+        return
+      self.__private_dirty = False
+      entries = [ (question, entry["sql"], entry["literals"],
+                   self.__private_matrix[entry["row"]].copy())
+                  for question, entry in self.__private_entries.items() ]
+    try:
+      self.path.parent.mkdir(parents=True, exist_ok=True)
+      tmp_path = self.path.with_suffix(".tmp")
+      with open(tmp_path, "w") as f:
+        json.dump([ { "question": question, "sql": sql, "literals": literals,
+                      "vector": vector.tolist() }
+                    for question, sql, literals, vector in entries ], f)
+      os.replace(tmp_path, self.path)
+    except Exception as e:
+      logging.error(f"Could not save semantic cache {self.path}: {e}")
+      with self.__private_lock:
+        self.__private_dirty = True
+
+  def stats(self) -> dict:
+    with self.__private_lock:
+      lookups = self.hits + self.misses
+      return { "entries": len(self.__private_entries),
+               "hits": self.hits,
+               "misses": self.misses,
+               "hit_ratio": self.hits / lookups if lookups else 0.0, }
+
+# End SemanticCache ============================================
@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+
+# Checks the SQL the agent generates before it runs. The prompt asks the
+# model for bounded reads only, this enforces it:
+#   - one statement, which must be a SELECT/WITH query (or SHOW, DESCRIBE,
+#     EXPLAIN), with no DML/DDL keywords, INTO, locking reads or functions
+#     that stall the server. EXPLAIN ANALYZE runs its query and is refused,
+#     and so are /*! */ and /*+ */ comments, which MySQL executes.
+#   - queries get a LIMIT of at most SQL_GUARD_LIMIT rows
+#   - on MySQL, EXPLAIN estimates the rows the query examines. Above
+#     SQL_GUARD_MAX_SCAN_ROWS the query is refused, or with
+#     SQL_GUARD_ON_EXPENSIVE=timeout run with a MAX_EXECUTION_TIME hint so
+#     the server stops it after SQL_GUARD_TIMEOUT_MS.
+
+import logging
+import os
+import re
+
+# SqlGuard ============================================
+SQL_GUARD_LIMIT = int(os.environ.get("SQL_GUARD_LIMIT", 100))
+SQL_GUARD_MAX_SCAN_ROWS = int(os.environ.get("SQL_GUARD_MAX_SCAN_ROWS", 1000000))
+SQL_GUARD_ON_EXPENSIVE = os.environ.get("SQL_GUARD_ON_EXPENSIVE", "refuse")    # refuse or timeout
+SQL_GUARD_TIMEOUT_MS = int(os.environ.get("SQL_GUARD_TIMEOUT_MS", 5000))
+
+_TOKEN = re.compile(r"""
+    (?P<comment>--(?=\s|$)[^\n]*|\#[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.)*")
+  | (?P<quoted>`[^`]*`)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<number>\d+)
+  | (?P<punct>[(),;@])
+  | (?P<other>\S)
+""", re.VERBOSE | re.DOTALL)
+
+READ_STATEMENTS = { "select", "with" }
+METADATA_STATEMENTS = { "show", "describe", "desc", "explain" }
+# Statement keywords can't appear at the top level of a query (MySQL 8
+# allows WITH ... DELETE). Several double as function names, e.g. REPLACE(),
+# so they are only refused when not followed by "(".
+STATEMENT_WORDS = { "insert", "update", "delete", "replace", "create", "alter", "drop",
+                    "truncate", "rename", "grant", "revoke", "lock", "unlock", "call",
+                    "load", "handler", "set", "do" }
+# SELECT ... INTO writes files or variables
+INTO_WORDS = { "into", "outfile", "dumpfile" }
+# Functions that hold the connection or read server files
+STALLING_FUNCTIONS = { "sleep", "benchmark", "get_lock", "load_file" }
+
+class SqlGuardError(ValueError):
+  pass
+
+class _Token:
+  def __init__(self, kind: str, text: str, start: int, end: int, depth: int):
+    self.kind = kind
+    self.text = text
+    self.start = start
+    self.end = end
+    self.depth = depth              # parenthesis nesting level
+
+  def isWord(self, *words) -> bool:
+    return self.kind == "word" and self.text.lower() in words
+
+def _tokens(sql: str) -> list[_Token]:
+  tokens = []
+  depth = 0
+  for m in _TOKEN.finditer(sql):
+    kind = m.lastgroup
+    if kind == "comment":
+      # Executable comments and optimizer hints are run by MySQL, the checks
+      # below would not see them
+      if m.group().startswith(("/*!", "/*+")):
+        raise SqlGuardError("/*! */ and /*+ */ comments are not allowed.")
+      continue
+    if m.group() == ")":
+      depth -= 1
+    tokens.append(_Token(kind, m.group(), m.start(), m.end(), depth))
+    if m.group() == "(":
+      depth += 1
+  return tokens
+
+# Rows MySQL expects to examine, from EXPLAIN output in join order. In a
+# nested loop join each table is read once per row that passed the tables
+# before it, so every select adds r1 + r1*f1*r2 + ...
+def estimatedScanRows(explain_rows: list[dict]) -> int:
+  total = 0.0
+  selects = {}
+  for row in explain_rows:
+    selects.setdefault(row.get("id"), []).append(row)
+  for rows in selects.values():
+    prefix = 1.0
+    for row in rows:
+      examined = float(row.get("rows") or 0)
+      total += prefix * examined
+      prefix *= examined * float(row.get("filtered") or 100) / 100
+  return int(total)
+
+class SqlGuard:
+
+  def __init__(self, engine=None, limit=SQL_GUARD_LIMIT, max_scan_rows=SQL_GUARD_MAX_SCAN_ROWS,
+                on_expensive=SQL_GUARD_ON_EXPENSIVE, timeout_ms=SQL_GUARD_TIMEOUT_MS):
+    if on_expensive not in ("refuse", "timeout"):
+      raise ValueError(f"on_expensive must be refuse or timeout, not {on_expensive}")
+    # EXPLAIN's output format is MySQL's
+    self.engine = engine if engine is not None and engine.dialect.name == "mysql" else None
+    self.limit = limit
+    self.max_scan_rows = max_scan_rows
+    self.on_expensive = on_expensive
+    self.timeout_ms = timeout_ms
+
+  # Private ============================================
+
+  def __private_checkRead(self, tokens: list[_Token]) -> str:
+    while tokens and tokens[-1].text == ";":
+      tokens.pop()
+    if not tokens:
+      raise SqlGuardError("Empty query.")
+    if any(token.text == ";" for token in tokens):
+      raise SqlGuardError("Only one statement can be run at a time.")
+    # (SELECT ...) UNION (SELECT ...) starts with a parenthesis
+    first = next((token for token in tokens if token.text != "("), tokens[0])
+    statement = first.text.lower()
+    if statement not in READ_STATEMENTS | METADATA_STATEMENTS:
+      raise SqlGuardError(f"Only SELECT queries are allowed, not {statement.upper()}.")
+    for i, token in enumerate(tokens):
+      is_call = i + 1 < len(tokens) and tokens[i + 1].text == "("
+      if token.isWord(*INTO_WORDS) \
+         or (token.isWord(*STALLING_FUNCTIONS) and is_call) \
+         or (token.isWord(*STATEMENT_WORDS) and token.depth == 0 and not is_call):
+        raise SqlGuardError(f"{token.text.upper()} is not allowed in a read-only query.")
+      # Locking reads lock inside subqueries and parenthesized queries too
+      if i + 1 < len(tokens) and ((token.isWord("for") and tokens[i + 1].isWord("update", "share"))
+                                  or (token.isWord("lock") and tokens[i + 1].isWord("in"))):
+        raise SqlGuardError("Locking reads are not allowed.")
+    return statement
+
+  # EXPLAIN ANALYZE (in any of its FORMAT= forms) runs the query it
+  # explains, without a LIMIT or cost check. A query explained without
+  # ANALYZE gets the same read-only check as when it is run.
+  def __private_checkMetadata(self, tokens: list[_Token]):
+    if not tokens[0].isWord("explain", "describe", "desc"):
+      return
+    if any(token.isWord("analyze") and token.depth == 0 for token in tokens):
+      raise SqlGuardError("EXPLAIN ANALYZE runs the query and is not allowed, use EXPLAIN.")
+    for i, token in enumerate(tokens[1:], 1):
+      if token.depth == 0 and token.isWord(*READ_STATEMENTS):
+        self.__private_checkRead(tokens[i:])
+        return
+
+  # sql with a top level LIMIT of at most self.limit rows
+  def __private_limited(self, sql: str, tokens: list[_Token]) -> str:
+    top = [ token for token in tokens if token.depth == 0 ]
+    limits = [ i for i, token in enumerate(top) if token.isWord("limit") ]
+    end = tokens[-1].end
+    if not limits:
+      return f"{sql[:end]} LIMIT {self.limit}"
+    # LIMIT n, LIMIT offset, n or LIMIT n OFFSET offset
+    after = top[limits[-1] + 1:]
+    count = after[2] if len(after) > 2 and after[1].text == "," else (after[0] if after else None)
+    if count is None or count.kind != "number":
+      raise SqlGuardError("LIMIT must be a number.")
+    if int(count.text) <= self.limit:
+      return sql[:end]
+    return f"{sql[:count.start]}{self.limit}{sql[count.end:end]}"
+
+  def __private_explain(self, sql: str) -> list[dict]:
+    with self.engine.connect() as conn:
+      # no_parameters: mysqlclient would %-format the SQL
+      result = conn.execution_options(no_parameters=True).exec_driver_sql(f"EXPLAIN {sql}")
+      return [ dict(row._mapping) for row in result ]
+
+  # Public ============================================
+
+  # The query to run in place of sql. Raises SqlGuardError if sql can't be
+  # run, with a message for the agent.
+  def check(self, sql: str) -> str:
+    tokens = _tokens(sql)
+    statement = self.__private_checkRead(tokens)
+    if statement in METADATA_STATEMENTS:
+      self.__private_checkMetadata(tokens)
+      return sql[:tokens[-1].end]
+    guarded = self.__private_limited(sql, tokens)
+    if self.engine is None:
+      return guarded
+    plan = self.__private_explain(guarded)
+    scan_rows = estimatedScanRows(plan)
+    if scan_rows <= self.max_scan_rows:
+      return guarded
+    full_scans = [ row.get("table") for row in plan if row.get("type") == "ALL" ]
+    logging.warning(f"Query estimated to examine {scan_rows} rows: {guarded}")
+    if self.on_expensive == "timeout" and tokens[0].isWord("select"):
+      select = tokens[0]
+      return (f"{guarded[:select.start]}SELECT /*+ MAX_EXECUTION_TIME({self.timeout_ms}) */"
+              f"{guarded[select.end:]}")
+    hint = f" Full table scans of: {', '.join(full_scans)}." if full_scans else ""
+    raise SqlGuardError(f"Query refused: it would examine about {scan_rows} rows, the limit is "
+                        f"{self.max_scan_rows}.{hint} Filter on indexed columns to narrow it.")
+
+# End SqlGuard ============================================
@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+
+# The SQL agent's query tool. LangChain's sql_db_query fetches the whole
+# result and formats it as one string, so a wide SELECT can hold a huge
+# string in memory and blow the context window. This version streams rows
+# from a server-side cursor and stops at a row and a byte budget. It
+# returns a compact tab-separated table with a trailer saying whether the
+# result was cut.
+
+import logging
+import os
+from typing import Any
+
+from langchain_community.agent_toolkits import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import QuerySQLDatabaseTool
+
+# Result budget ============================================
+SQL_RESULT_MAX_ROWS = int(os.environ.get("SQL_RESULT_MAX_ROWS", 100))
+SQL_RESULT_MAX_BYTES = int(os.environ.get("SQL_RESULT_MAX_BYTES", 16384))
+SQL_RESULT_MAX_CELL_CHARS = 200     # longer values are cut with "..."
+STREAM_BATCH_ROWS = 100             # rows fetched from the cursor at a time
+
+def _cell(value) -> str:
+  if value is None:
+    return "NULL"
+  text = str(value)
+  if len(text) > SQL_RESULT_MAX_CELL_CHARS:
+    text = text[:SQL_RESULT_MAX_CELL_CHARS] + "..."
+  return text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+def _line(values) -> str:
+  return "\t".join(_cell(value) for value in values)
+
+# Yields batches of rows from a server-side (unbuffered) cursor, so rows
+# past the budget are never held in memory. SQLAlchemy's mysqlconnector
+# dialect buffers results and can't stream, so that driver is read through
+# an unbuffered DBAPI cursor.
+def _streamRows(conn, sql: str):
+  if conn.dialect.driver == "mysqlconnector":
+    dbapi_connection = conn.connection.dbapi_connection
+    cursor = dbapi_connection.cursor(buffered=False)
+    try:
+      cursor.execute(sql)
+      yield [ column[0] for column in cursor.description or [] ]
+      while batch := cursor.fetchmany(STREAM_BATCH_ROWS):
+        yield batch
+    finally:
+      # Closing a cursor with rows left unread raises "Unread result found",
+      # read and discard them first
+      dbapi_connection.consume_results()
+      cursor.close()
+    return
+  # no_parameters: the SQL is run as is, so drivers that format parameters
+  # with % (mysqlclient) don't choke on LIKE '%x%'
+  result = conn.execution_options(stream_results=True, no_parameters=True).exec_driver_sql(sql)
+  try:
+    yield list(result.keys()) if result.returns_rows else []
+    while result.returns_rows and (batch := result.fetchmany(STREAM_BATCH_ROWS)):
+      yield batch
+  finally:
+    result.close()
+
+# Runs sql and returns at most max_rows rows and about max_bytes of text:
+# a header line of column names, one tab-separated line per row, and a
+# trailer with the row count and why the result was cut, if it was.
+def streamQuery(engine, sql: str, max_rows=SQL_RESULT_MAX_ROWS,
+                max_bytes=SQL_RESULT_MAX_BYTES) -> str:
+  with engine.connect() as conn:
+    batches = _streamRows(conn, sql)
+    columns = next(batches)
+    if not columns:
+      # not committed: the connection rolls back when it goes back to the pool
+      batches.close()
+      return "[statement returned no rows]"
+    lines = [ _line(columns) ]
+    size = len(lines[0].encode("utf-8")) + 1
+    rows = 0
+    truncated = None
+    for batch in batches:
+      for row in batch:
+        if rows >= max_rows:
+          truncated = f"the {max_rows} row limit"
+          break
+        line = _line(row)
+        size += len(line.encode("utf-8")) + 1
+        if size > max_bytes:
+          truncated = f"the {max_bytes} byte limit"
+          break
+        lines.append(line)
+        rows += 1
+      if truncated:
+        break
+    batches.close()
+  if truncated:
+    lines.append(f"[{rows} rows shown, more rows were cut at {truncated}]")
+    logging.info(f"Query result cut at {truncated}: {sql}")
+  else:
+    lines.append(f"[{rows} rows]")
+  return "\n".join(lines)
+
+# Tools ============================================
+
+class StreamingQuerySQLDatabaseTool(QuerySQLDatabaseTool):
+  # sql_db_query with a bounded result, errors are returned to the agent
+  # so it can rewrite the query. Results are served from and kept in
+  # query_cache (a querycache.QueryCache) if one is given. sql_guard (a
+  # sqlguard.SqlGuard) checks and bounds queries before they run.
+  query_cache: Any = None
+  sql_guard: Any = None
+
+  def _run(self, query: str, run_manager=None) -> str:
+    database = self.db._engine.url.database
+    if self.query_cache is not None:
+      result = self.query_cache.get(database, query)
+      if result is not None:
+        return result
+    try:
+      sql = self.sql_guard.check(query) if self.sql_guard is not None else query
+      result = streamQuery(self.db._engine, sql)
+    except Exception as e:
+      return f"Error: {e}"
+    if self.query_cache is not None:
+      self.query_cache.put(database, query, result)
+    return result
+
+class StreamingSQLDatabaseToolkit(SQLDatabaseToolkit):
+  # SQLDatabaseToolkit with sql_db_query swapped for the streaming version
+  query_cache: Any = None
+  sql_guard: Any = None
+
+  def get_tools(self):
+    tools = super().get_tools()
+    return [ StreamingQuerySQLDatabaseTool(db=self.db, description=tool.description,
+                                           query_cache=self.query_cache,
+                                           sql_guard=self.sql_guard)
+             if isinstance(tool, QuerySQLDatabaseTool) else tool
+             for tool in tools ]
@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+
+# Picks the tables relevant to a question so the SQL agent prompt carries a
+# few table definitions instead of the whole schema. The index is built
+# locally from the cached table descriptions: table and column names,
+# comments and the sample rows. Questions are scored against it with BM25.
+
+import math
+import re
+from collections import Counter
+
+# TableRetriever ============================================
+TABLE_RETRIEVER_TOP_K = 5           # tables put in the prompt per question
+TABLE_NAME_WEIGHT = 3               # a hit on the table name counts this many times
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+_REFERENCES = re.compile(r"REFERENCES\s+`?(\w+)`?", re.IGNORECASE)
+
+# Lower case word stems: splits snake_case and camelCase identifiers and
+# drops a plural "s", so "owner_id", "ownerId" and "owners" all match "owner"
+def terms(text: str) -> list[str]:
+  words = [ word.lower() for word in _WORD.findall(text) ]
+  return [ word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss")
+           else word for word in words ]
+
+class TableRetriever:
+
+  def __init__(self, table_infos: dict[str, str], top_k=TABLE_RETRIEVER_TOP_K):
+    self.table_infos = table_infos
+    self.top_k = top_k
+    self.__private_tf = {}
+    self.__private_length = {}
+    self.__private_references = {}
+    for table, info in table_infos.items():
+      tf = Counter(terms(info))
+      for term in terms(table):
+        tf[term] += TABLE_NAME_WEIGHT
+      self.__private_tf[table] = tf
+      self.__private_length[table] = sum(tf.values())
+      self.__private_references[table] = \
+        [ ref for ref in _REFERENCES.findall(info) if ref in table_infos and ref != table ]
+    self.__private_avgLength = \
+      sum(self.__private_length.values()) / len(table_infos) if table_infos else 0
+    df = Counter(term for tf in self.__private_tf.values() for term in tf)
+    n = len(table_infos)
+    self.__private_idf = { term: math.log(1 + (n - count + 0.5) / (count + 0.5))
+                           for term, count in df.items() }
+
+  # Private ============================================
+
+  def __private_score(self, table: str, query_terms: list[str]) -> float:
+    tf = self.__private_tf[table]
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.__private_length[table] / self.__private_avgLength)
+    score = 0.0
+    for term in query_terms:
+      freq = tf.get(term, 0)
+      if freq:
+        score += self.__private_idf[term] * freq * (BM25_K1 + 1) / (freq + norm)
+    return score
+
+  # Public ============================================
+
+  # Names of the top_k tables for the question, best first, followed by any
+  # tables they reference through foreign keys so joins can be written
+  def relevantTables(self, question: str) -> list[str]:
+    if len(self.table_infos) <= self.top_k:
+      return sorted(self.table_infos)
+    query_terms = set(terms(question))
+    scores = { table: self.__private_score(table, query_terms) for table in self.table_infos }
+    ranked = sorted(self.table_infos, key=lambda table: (-scores[table], table))
+    selected = ranked[:self.top_k]
+    for table in list(selected):
+      for ref in self.__private_references[table]:
+        if ref not in selected:
+          selected.append(ref)
+    return selected
+
+  # Definitions of the relevant tables, joined like SQLDatabase.get_table_info()
+  def tableInfo(self, question: str) -> str:
+    return "\n\n".join(sorted(self.table_infos[table] for table in self.relevantTables(question)))
+
+# End TableRetriever ============================================
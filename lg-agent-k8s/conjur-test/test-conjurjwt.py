@@ -2,8 +2,7 @@
 
 import json
 import logging
-import requests
-from conjurjwt import ConjurRetrieverJwt
+from conjurjwt import ConjurRetrieverJwt, getHttpSession
 
 # function to get JWT from IDP given only a workload ID as parameter
 def jwtProvider_jwtThis(workload_id: str) -> str:
@@ -11,8 +10,8 @@ def jwtProvider_jwtThis(workload_id: str) -> str:
   jwt_issuer_url = "http://localhost:8000/token"
   urlenc_headers= { "Content-Type": "application/x-www-form-urlencoded" }
   payload = f"workload={workload_id}"
-  resp_dict = json.loads(requests.request("POST", jwt_issuer_url,
-                            headers=urlenc_headers, data=payload).text)
+  resp_dict = json.loads(getHttpSession().request("POST", jwt_issuer_url,
+                                    headers=urlenc_headers, data=payload).text)
   jwt = ""
   if resp_dict:
     jwt = resp_dict['access_token']
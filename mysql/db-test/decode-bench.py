@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+
+# Compares how fast each MySQL driver fetches and decodes a large result
+# set. Generates a petclinic-shaped table (pets joined with their type and
+# owner, plus a visit note), then times SELECT * with every driver that is
+# installed, keeping the best of --repeat runs.
+#
+#   python decode-bench.py --host 192.168.49.2 --port 32509 --rows 200000
+#   python decode-bench.py --drivers mysqlconnector-pure mysqlconnector --keep
+#
+# The table is dropped afterwards unless --keep is given; with --keep, a
+# later run reuses it if it has the requested number of rows.
+
+import argparse
+import asyncio
+import datetime
+import time
+
+TABLE = "bench_pets"
+INSERT_BATCH = 5000
+
+DRIVERS = ["mysqlconnector-pure", "mysqlconnector", "mysqlclient", "asyncmy", "aiomysql"]
+
+CREATE_TABLE = f"""
+CREATE TABLE IF NOT EXISTS {TABLE} (
+  id INT UNSIGNED NOT NULL PRIMARY KEY,
+  name VARCHAR(30),
+  birth_date DATE,
+  type_name VARCHAR(80),
+  owner_first_name VARCHAR(30),
+  owner_last_name VARCHAR(30),
+  address VARCHAR(255),
+  city VARCHAR(80),
+  telephone VARCHAR(20),
+  visit_date DATE,
+  visit_description VARCHAR(255)
+) engine=InnoDB
+"""
+
+def generated_row(i: int) -> tuple:
+  birth_date = datetime.date(2010, 1, 1) + datetime.timedelta(days=i % 5000)
+  return (i, f"Name{i}", birth_date, f"Type{i % 6}", f"Firstname{i % 1000}",
+          f"Lastname{i % 1000}", f"{i % 997} Address{i % 1000} St.", f"City{i % 80}",
+          f"608555{i % 10000:04d}", birth_date + datetime.timedelta(days=365),
+          f"Visit {i}: rabies shot and checkup")
+
+def connect(args, driver: str):
+  if driver.startswith("mysqlconnector"):
+    import mysql.connector
+    return mysql.connector.connect(host=args.host, port=args.port, user=args.user,
+                                   password=args.password, database=args.database,
+                                   use_pure=(driver == "mysqlconnector-pure"))
+  if driver == "mysqlclient":
+    import MySQLdb
+    return MySQLdb.connect(host=args.host, port=args.port, user=args.user,
+                           password=args.password, database=args.database)
+  raise ValueError(f"{driver} is not a sync driver")
+
+async def connect_async(args, driver: str):
+  if driver == "asyncmy":
+    import asyncmy
+    return await asyncmy.connect(host=args.host, port=args.port, user=args.user,
+                                 password=args.password, database=args.database)
+  import aiomysql
+  return await aiomysql.connect(host=args.host, port=args.port, user=args.user,
+                                password=args.password, db=args.database)
+
+def installed(driver: str) -> bool:
+  module = { "mysqlconnector-pure": "mysql.connector", "mysqlconnector": "mysql.connector",
+             "mysqlclient": "MySQLdb", "asyncmy": "asyncmy", "aiomysql": "aiomysql" }[driver]
+  try:
+    __import__(module)
+  except ImportError:
+    return False
+  if driver == "mysqlconnector":
+    import mysql.connector
+    return mysql.connector.HAVE_CEXT
+  return True
+
+def generate_table(args):
+  cnx = connect(args, "mysqlconnector-pure")
+  cursor = cnx.cursor()
+  cursor.execute(CREATE_TABLE)
+  cursor.execute(f"SELECT COUNT(*) FROM {TABLE}")
+  if cursor.fetchone()[0] == args.rows:
+    print(f"Reusing {TABLE} with {args.rows} rows")
+  else:
+    print(f"Generating {TABLE} with {args.rows} rows")
+    cursor.execute(f"TRUNCATE TABLE {TABLE}")
+    insert = f"INSERT INTO {TABLE} VALUES ({', '.join(['%s'] * 11)})"
+    for start in range(0, args.rows, INSERT_BATCH):
+      rows = [ generated_row(i) for i in range(start, min(start + INSERT_BATCH, args.rows)) ]
+      cursor.executemany(insert, rows)
+    cnx.commit()
+  cursor.close()
+  cnx.close()
+
+def drop_table(args):
+  cnx = connect(args, "mysqlconnector-pure")
+  cursor = cnx.cursor()
+  cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+  cursor.close()
+  cnx.close()
+
+# Seconds to fetch and decode every row, and the number of rows
+def time_sync(args, driver: str) -> tuple[float, int]:
+  cnx = connect(args, driver)
+  cursor = cnx.cursor()
+  start = time.perf_counter()
+  cursor.execute(f"SELECT * FROM {TABLE}")
+  rows = cursor.fetchall()
+  elapsed = time.perf_counter() - start
+  cursor.close()
+  cnx.close()
+  return elapsed, len(rows)
+
+async def time_async(args, driver: str) -> tuple[float, int]:
+  cnx = await connect_async(args, driver)
+  async with cnx.cursor() as cursor:
+    start = time.perf_counter()
+    await cursor.execute(f"SELECT * FROM {TABLE}")
+    rows = await cursor.fetchall()
+    elapsed = time.perf_counter() - start
+  cnx.close()
+  return elapsed, len(rows)
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--host", default="192.168.49.2")
+  parser.add_argument("--port", type=int, default=32509)
+  parser.add_argument("--user", default="test_user1")
+  parser.add_argument("--password", default="UHGMLk1")
+  parser.add_argument("--database", default="petclinic")
+  parser.add_argument("--rows", type=int, default=200000)
+  parser.add_argument("--repeat", type=int, default=3)
+  parser.add_argument("--drivers", nargs="+", default=DRIVERS, choices=DRIVERS)
+  parser.add_argument("--keep", action="store_true", help=f"don't drop {TABLE} afterwards")
+  args = parser.parse_args()
+
+  generate_table(args)
+  try:
+    print(f"{'driver':<20} {'rows':>8} {'best secs':>10} {'rows/sec':>12} {'usec/row':>9}")
+    for driver in args.drivers:
+      if not installed(driver):
+        print(f"{driver:<20} not installed")
+        continue
+      runs = []
+      for _ in range(args.repeat):
+        if driver in ("asyncmy", "aiomysql"):
+          runs.append(asyncio.run(time_async(args, driver)))
+        else:
+          runs.append(time_sync(args, driver))
+      best, rows = min(runs)
+      print(f"{driver:<20} {rows:>8} {best:>10.3f} {rows / best:>12,.0f} {best / rows * 1e6:>9.2f}")
+  finally:
+    if not args.keep:
+      drop_table(args)
+
+if __name__ == "__main__":
+  main()
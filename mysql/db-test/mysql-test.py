@@ -1,36 +1,71 @@
 #!/usr/bin/python3
 
-import mysql.connector
-from mysql.connector import errorcode
+# MYSQL_DRIVER picks the driver: mysqlconnector (C extension, default),
+# mysqlclient, or the async asyncmy / aiomysql.
+
+import asyncio
+import os
 
 config = {
   'user': 'test_user1',
   'password': 'UHGMLk1',
   'host': '192.168.49.2',       # minikube ip
-  'port': '32509',              # nodeport
+  'port': 32509,                # nodeport
   'database': 'petclinic',
-  'raise_on_warnings': True
 }
 
-try:
-  cnx = mysql.connector.connect(**config)
-except mysql.connector.Error as err:
-  if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
-    print("Something is wrong with your user name or password")
-  elif err.errno == errorcode.ER_BAD_DB_ERROR:
-    print("Database does not exist")
-  else:
-    print(err)
+query = ("select name, birth_date from pets")
 
-cursor = cnx.cursor()
+def print_pets(rows):
+  for (name, birth_date) in rows:
+    print("{} was born on {:%d %b %Y}".format(
+      name, birth_date))
 
-query = ("select name, birth_date from pets")
+def connect_mysqlconnector():
+  import mysql.connector
+  from mysql.connector import errorcode
+  try:
+    # use_pure=False: fail rather than fall back to the pure Python protocol
+    return mysql.connector.connect(**config, raise_on_warnings=True, use_pure=False)
+  except mysql.connector.Error as err:
+    if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
+      print("Something is wrong with your user name or password")
+    elif err.errno == errorcode.ER_BAD_DB_ERROR:
+      print("Database does not exist")
+    else:
+      print(err)
+    raise
+
+def connect_mysqlclient():
+  import MySQLdb
+  return MySQLdb.connect(**config)
 
-cursor.execute(query)
+def run_sync(cnx):
+  cursor = cnx.cursor()
+  cursor.execute(query)
+  print_pets(cursor)
+  cursor.close()
+  cnx.close()
 
-for (name, birth_date) in cursor:
-  print("{} was born on {:%d %b %Y}".format(
-    name, birth_date))
+async def run_async(driver: str):
+  if driver == "asyncmy":
+    import asyncmy
+    cnx = await asyncmy.connect(**config)
+  else:
+    import aiomysql
+    aio_config = { k: v for k, v in config.items() if k != 'database' }
+    cnx = await aiomysql.connect(**aio_config, db=config['database'])
+  async with cnx.cursor() as cursor:
+    await cursor.execute(query)
+    print_pets(await cursor.fetchall())
+  cnx.close()
 
-cursor.close()
-cnx.close()
+driver = os.environ.get("MYSQL_DRIVER", "mysqlconnector")
+if driver == "mysqlconnector":
+  run_sync(connect_mysqlconnector())
+elif driver == "mysqlclient":
+  run_sync(connect_mysqlclient())
+elif driver in ("asyncmy", "aiomysql"):
+  asyncio.run(run_async(driver))
+else:
+  print(f"Unknown MYSQL_DRIVER {driver}")